@@ -1,10 +1,12 @@
 import logging
-import queue
 import asyncio
+import collections
+import json
 import contextlib
 #import csv # only for debugging
 #import datetime # only for debugging
 from   bleak        import BleakClient, BleakScanner, BleakGATTCharacteristic
+from   bleak.backends.device import BLEDevice
 from   bleak.exc    import BleakDBusError
 from   datatypes    import DataContainer, MinMaxIncrement, QueueEntry
 from   data_parsers import parse_hr_measurement, parse_indoor_bike_data
@@ -13,24 +15,101 @@ class BLE_Device:
     def __init__(self):
         self.address: str = None
         self.name: str = None
-        self.connect: bool = True
+        self._connect: bool = True
         self.connectionState: bool = False
-        self.queue = queue.SimpleQueue()
+        self.queue: asyncio.Queue = None        # commands for the connection task, see next_command()
+        self.stateChanged: asyncio.Event = None # set when connect or the state of the link changes
+        self.loop: asyncio.AbstractEventLoop = None     # loop running the connection task, the two above belong to it
+        self.pending = collections.deque()      # commands given while no connection task is bound, see bind_loop()
         self.dataContainer: DataContainer = None
         self.hasLock: bool = False
         self.advertised_service_uuid = str()
 
+    @property
+    def connect(self) -> bool:
+        return self._connect
+
+    @connect.setter
+    def connect(self, value: bool) -> None:
+        if value != self._connect:
+            self._connect = value
+            self.notify_state_change()
+
+    def call_in_loop(self, function, *args) -> None:
+        """Calls function in the loop of the connection task, directly when already running in it"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self.loop is None or self.loop is running or self.loop.is_closed():
+            function(*args)
+        else:
+            self.loop.call_soon_threadsafe(function, *args)
+
+    def bind_loop(self) -> None:
+        """Creates the command queue and the state event in the running loop, every asyncio.run() has its own.
+        Commands given before, or left in the queue of a previous loop, are moved over."""
+        loop = asyncio.get_running_loop()
+        if self.loop is loop:
+            return
+        previous = self.queue
+        self.loop = loop
+        self.stateChanged = asyncio.Event()
+        self.queue = asyncio.Queue()
+        while previous is not None and not previous.empty():
+            self.queue.put_nowait(previous.get_nowait())
+        self.move_pending()
+
+    def move_pending(self) -> None:
+        while self.pending:
+            self.queue.put_nowait(self.pending.popleft())
+
+    def put(self, entry: QueueEntry) -> None:
+        if self.queue is None:
+            self.pending.append(entry)
+        else:
+            self.call_in_loop(self.queue.put_nowait, entry)
+
+    def commands_pending(self) -> bool:
+        return len(self.pending) > 0 or (self.queue is not None and not self.queue.empty())
+
+    def notify_state_change(self) -> None:
+        if self.stateChanged is not None:       #### a connection task not started yet reads the state anyway
+            self.call_in_loop(self.stateChanged.set)
+
+    def on_disconnect(self, client: BleakClient) -> None:
+        print(self.name, ": link lost")
+        self.notify_state_change()
+
+    async def wait_for_state_change(self) -> None:
+        self.stateChanged.clear()
+        await self.stateChanged.wait()
+
+    async def next_command(self) -> QueueEntry:
+        """Waits for the next command, returns None if connect or the state of the link changed first"""
+        self.move_pending()
+        if not self.queue.empty():
+            return self.queue.get_nowait()
+
+        self.stateChanged.clear()
+        getter = asyncio.ensure_future(self.queue.get())
+        changed = asyncio.ensure_future(self.stateChanged.wait())
+        done, pending = await asyncio.wait((getter, changed), return_when = asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()       # a cancelled get() leaves the command in the queue
+        return getter.result() if getter in done else None
+
     def subscribeToService(self, service_uuid, callback = None):
-        self.queue.put(QueueEntry('Subscribe', {'UUID': service_uuid, 'Callback': callback}))
+        self.put(QueueEntry('Subscribe', {'UUID': service_uuid, 'Callback': callback}))
 
     def unsubscribeFromService(self, service_uuid):
-        self.queue.put(QueueEntry('Unsubscribe', service_uuid))
+        self.put(QueueEntry('Unsubscribe', service_uuid))
 
     def readFromService(self, service_uuid):
-        self.queue.put(QueueEntry('Read', service_uuid))
+        self.put(QueueEntry('Read', service_uuid))
 
     def writeToService(self, service_uuid, message):
-        self.queue.put(QueueEntry('Write', {'UUID': service_uuid, 'Message': message}))
+        self.put(QueueEntry('Write', {'UUID': service_uuid, 'Message': message}))
 
 
     async def discover_available_devices(self):
@@ -45,16 +124,17 @@ class BLE_Device:
         
 
 
-    async def connection_to_BLE_Device(self, lock: asyncio.Lock, container: DataContainer):
+    async def connection_to_BLE_Device(self, manager: "ConnectionManager", container: DataContainer):
         
         self.dataContainer = container
+        self.bind_loop()
         print("starting task:", self.name)
         while(self.dataContainer.programRunningFlag == True):
             self.hasLock = False
 
             if self.connect == False and self.connectionState == False:
                 #print("Staying off")
-                await asyncio.sleep(0.1)
+                await self.wait_for_state_change()
                 continue
 
             elif self.connectionState == True:
@@ -64,77 +144,75 @@ class BLE_Device:
                 try:
                     async with contextlib.AsyncExitStack() as stack:
 
-                        # Trying to establish a connection to two+ devices at the same time
-                        # can cause errors, so use a lock to avoid this.
-                        print(self.name, ": awaiting lock")
-                        async with lock:
-                            self.hasLock = True
-                            print("scanning for ", self.name)
-                            device = await BleakScanner.find_device_by_address(self.address)
-
-                            if device is None:
-                                print(self.name, " not found")
-                                self.connectionState = False
-                                self.connect = False
-                                continue
-
-                            client = BleakClient(device)
-                            
-                            print("connecting to ", self.name)
+                        self.hasLock = True
+                        device = await manager.resolve(self)
 
-                            await stack.enter_async_context(client)
+                        if device is None:
+                            print(self.name, " not found")
+                            self.connectionState = False
+                            self.connect = False
+                            continue
 
-                            print("connected to ", self.name)
-                            self.connectionState = True
+                        client = BleakClient(device, disconnected_callback = self.on_disconnect,
+                                             services = manager.services.get(self.address.upper()))
 
-                            # This will be called immediately before client.__aexit__ when
-                            # the stack context manager exits.
-                            stack.callback(print, "disconnecting from ", self.name)
-                        
-                        # The lock is released here. The device is still connected and the
-                        # Bluetooth adapter is now free to scan and connect another device
-                        # without disconnecting this one.
+                        # Trying to establish a connection to too many devices at the same time
+                        # can cause errors, the manager bounds how many connect at once.
+                        async with manager.connecting:
+                            print("connecting to ", self.name)
+                            try:
+                                await stack.enter_async_context(client)
+                            except Exception:
+                                manager.forget(self)    #### stale handle or service table, scan again on the next attempt
+                                raise
+
+                        print("connected to ", self.name)
+                        manager.remember(self, client)
+
+                        # This will be called immediately before client.__aexit__ when
+                        # the stack context manager exits.
+                        stack.callback(print, "disconnecting from ", self.name)
 
                         self.connectionState = True
                         
-                        while self.connect and container.programRunningFlag:  ####    Internal state machine running while connected - Sending commands happen here
-                            await asyncio.sleep(0)
-
-                            if not self.queue.empty():
-                                try:
-                                    entry: QueueEntry = self.queue.get(timeout = 0.2)
-                                    if entry.type == 'Subscribe':
-                                        #print("subscribe")
-                                       
-                                        if entry.data["Callback"] is None:
-                                            funtionToRegisterForCallback = self.Callback
-                                        else:
-                                            funtionToRegisterForCallback = entry.data["Callback"]
-
-                                        await client.start_notify(entry.data["UUID"], funtionToRegisterForCallback)
-
-                                    elif entry.type == 'Unsubscribe':
-                                        #print('unsub')
-                                        await client.stop_notify(entry.data["UUID"])
-                                        
-                                    elif entry.type == 'Read':
-                                        #print('Read')
-                                        message = await client.read_gatt_char(entry.data)
-                                        self.incomingMessageHandler(entry.data, message)
+                        while self.connect and container.programRunningFlag and client.is_connected:  ####    Internal state machine running while connected - Sending commands happen here
+                            entry: QueueEntry = await self.next_command()
+                            if entry is None:
+                                continue    # woken up to check the state
+
+                            try:
+                                if entry.type == 'Subscribe':
+                                    #print("subscribe")
+                                   
+                                    if entry.data["Callback"] is None:
+                                        funtionToRegisterForCallback = self.Callback
+                                    else:
+                                        funtionToRegisterForCallback = entry.data["Callback"]
+
+                                    await client.start_notify(entry.data["UUID"], funtionToRegisterForCallback)
+
+                                elif entry.type == 'Unsubscribe':
+                                    #print('unsub')
+                                    await client.stop_notify(entry.data["UUID"])
                                     
-                                    elif entry.type == 'Write':
-                                        #print('Write:\t', entry.data["Message"])
-                                        while(True):
-                                            try:
-                                                await client.write_gatt_char(entry.data["UUID"], entry.data["Message"] , True)
-                                        
-                                            except BleakDBusError as e:
-                                                print("BleakDBusError, retrying...")
-                                                print(e)
-                                                continue
-                                            break
-                                except:
-                                    pass
+                                elif entry.type == 'Read':
+                                    #print('Read')
+                                    message = await client.read_gatt_char(entry.data)
+                                    self.incomingMessageHandler(entry.data, message)
+                                
+                                elif entry.type == 'Write':
+                                    #print('Write:\t', entry.data["Message"])
+                                    while(True):
+                                        try:
+                                            await client.write_gatt_char(entry.data["UUID"], entry.data["Message"] , True)
+                                    
+                                        except BleakDBusError as e:
+                                            print("BleakDBusError, retrying...")
+                                            print(e)
+                                            continue
+                                        break
+                            except:
+                                pass
 
                     # The stack context manager exits here, triggering disconnection.
                     self.connectionState = False
@@ -146,6 +224,113 @@ class BLE_Device:
             print("stopping task:", self.name)
 
 
+class ConnectionManager:
+    """Connects the BLE devices. Devices without a known BLEDevice handle are looked for in one scan shared by
+    all of them: each one gets its handle as soon as its advertisement arrives, while the scan goes on for the
+    others, and up to max_connecting devices connect at the same time. The services holding the characteristics
+    a device uses are saved to cache_path, so from the first connection on, also after a restart, only those
+    are discovered. BLEDevice handles only live as long as the program: reconnecting needs no scan, while
+    starting up still takes one shared scan."""
+
+    SCAN_TIMEOUT = 10.0     # seconds a device is looked for
+
+    def __init__(self, devices: list, max_connecting: int = 2, cache_path: str = None) -> None:
+        self.devices = devices
+        self.handles = dict()               # address -> BLEDevice
+        self.services = dict()              # address -> UUIDs of the services to discover on connection
+        self.waiting = dict()               # address -> future of the handle, for the devices the scan looks for
+        self.scanner: asyncio.Task = None   # the shared scan, None while there is none
+        self.deadline: float = None         # when the scan gives up on the devices still waiting
+        self.scanLock = asyncio.Lock()      # held while scanning, also by the Supervisor's discovery page
+        self.connecting = asyncio.Semaphore(max_connecting)
+        self.cache_path = cache_path
+        if cache_path is not None:
+            try:
+                with open(cache_path, "rt") as file:
+                    self.services = json.load(file)
+            except (OSError, ValueError):
+                pass        #### no cache yet, or a damaged one rebuilt on the next connections
+
+    def save(self) -> None:
+        if self.cache_path is not None:
+            with open(self.cache_path, "wt") as file:
+                json.dump(self.services, file, indent = 2)
+
+    async def resolve(self, device: BLE_Device) -> BLEDevice:
+        """BLEDevice handle of device, None if it was not found or has no address"""
+        if device.address is None:
+            return None
+        address = device.address.upper()
+        if address in self.handles:
+            return self.handles[address]
+
+        loop = asyncio.get_running_loop()
+        future = self.waiting.get(address)
+        if future is None or future.done():
+            future = self.waiting[address] = loop.create_future()
+            self.deadline = loop.time() + self.SCAN_TIMEOUT
+        if self.scanner is None:
+            self.scanner = asyncio.ensure_future(self.scan())
+        return await future
+
+    async def scan(self) -> None:
+        """Scans while devices are waiting for their handle, until SCAN_TIMEOUT after the last one joined"""
+        loop = asyncio.get_running_loop()
+        found = asyncio.Event()     # set when no device is waiting any more
+
+        def detected(handle: BLEDevice, advertisement) -> None:
+            if handle.address is None:
+                return
+            address = handle.address.upper()
+            future = self.waiting.pop(address, None)
+            if future is not None:
+                self.handles[address] = handle
+                if not future.done():
+                    future.set_result(handle)
+                if len(self.waiting) == 0:
+                    found.set()
+
+        print("scanning for ", ", ".join(device.name for device in self.devices if device.address is not None
+                                         and device.address.upper() in self.waiting))
+        stopped = False     # the scan ended on its own, not through an error or cancellation
+        try:
+            async with self.scanLock:
+                self.deadline = max(self.deadline, loop.time() + self.SCAN_TIMEOUT)    # not counting the wait for the lock
+                async with BleakScanner(detection_callback = detected):
+                    while len(self.waiting) > 0 and loop.time() < self.deadline:
+                        found.clear()
+                        try:
+                            await asyncio.wait_for(found.wait(), self.deadline - loop.time())
+                        except asyncio.TimeoutError:
+                            pass        #### a device which joined later may extend the deadline
+            stopped = True
+        finally:
+            self.scanner = None
+            if stopped and len(self.waiting) > 0 and loop.time() < self.deadline:
+                self.scanner = asyncio.ensure_future(self.scan())       # joined while the scanner was stopping
+            else:
+                for future in self.waiting.values():
+                    if not future.done():
+                        future.set_result(None)
+                self.waiting.clear()
+
+    def remember(self, device: BLE_Device, client: BleakClient) -> None:
+        """Keeps the services holding the characteristics of device, so the next connection only discovers those"""
+        used = set(value for name, value in vars(type(device)).items() if name.startswith("UUID_"))
+        services = [service.uuid for service in client.services if any(characteristic.uuid in used for characteristic in service.characteristics)]
+        if len(services) > 0 and self.services.get(device.address.upper()) != services:
+            self.services[device.address.upper()] = services
+            self.save()
+
+    def forget(self, device: BLE_Device) -> None:
+        self.handles.pop(device.address.upper(), None)
+        if self.services.pop(device.address.upper(), None) is not None:
+            self.save()
+
+    async def run(self, container: DataContainer) -> None:
+        await asyncio.gather(*[device.connection_to_BLE_Device(self, container) for device in self.devices])
+
+
 class HeartRateMonitor(BLE_Device):
     UUID_HR_measurement: str = '00002a37-0000-1000-8000-00805f9b34fb'
     uuid_heart_rate_service = "0000180d-0000-1000-8000-00805f9b34fb"
@@ -20,7 +20,11 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import RPi.GPIO
+try:
+    import RPi.GPIO
+except ImportError:
+    # Not running on a Raspberry Pi, only the headless display backends are usable.
+    RPi = None
 
 OUT     = 0
 IN      = 1
@@ -258,4 +262,6 @@ class RPiGPIOAdapter(BaseGPIO):
 
 def get_platform_gpio(**keywords):
 
+    if RPi is None:
+        raise RuntimeError('RPi.GPIO is not available on this platform.')
     return RPiGPIOAdapter(RPi.GPIO, **keywords)
\ No newline at end of file
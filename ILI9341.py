@@ -19,7 +19,11 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
+import functools
+import math
 import numbers
+import struct
+import threading
 import time
 import numpy as np
 
@@ -98,6 +102,42 @@ ILI9341_MAGENTA     = 0xF81F
 ILI9341_YELLOW      = 0xFFE0
 ILI9341_WHITE       = 0xFFFF
 
+# Initialisation sequence sent by begin(): command, parameter bytes and the
+# time in seconds to wait after it.
+ILI9341_INIT_SEQUENCE = (
+    (0xEF,              b'\x03\x80\x02',             0),
+    (0xCF,              b'\x00\xC1\x30',             0),
+    (0xED,              b'\x64\x03\x12\x81',         0),
+    (0xE8,              b'\x85\x00\x78',             0),
+    (0xCB,              b'\x39\x2C\x00\x34\x02',     0),
+    (0xF7,              b'\x20',                     0),
+    (0xEA,              b'\x00\x00',                 0),
+    (ILI9341_PWCTR1,    b'\x23',                     0),     # Power control, VRH[5:0]
+    (ILI9341_PWCTR2,    b'\x10',                     0),     # Power control, SAP[2:0];BT[3:0]
+    (ILI9341_VMCTR1,    b'\x3E\x28',                 0),     # VCM control
+    (ILI9341_VMCTR2,    b'\x86',                     0),     # VCM control2
+    (ILI9341_MADCTL,    b'\x48',                     0),     # Memory Access Control
+    (ILI9341_PIXFMT,    b'\x55',                     0),
+    (ILI9341_FRMCTR1,   b'\x00\x18',                 0),
+    (ILI9341_DFUNCTR,   b'\x08\x82\x27',             0),     # Display Function Control
+    (0xF2,              b'\x00',                     0),     # 3Gamma Function Disable
+    (ILI9341_GAMMASET,  b'\x01',                     0),     # Gamma curve selected
+    (ILI9341_GMCTRP1,   b'\x0F\x31\x2B\x0C\x0E\x08\x4E\xF1\x37\x07\x10\x03\x0E\x09\x00', 0),    # Set Gamma
+    (ILI9341_GMCTRN1,   b'\x00\x0E\x14\x03\x11\x07\x31\xC1\x48\x08\x0F\x0C\x31\x36\x0F', 0),    # Set Gamma
+    (ILI9341_SLPOUT,    b'',                         0.120), # Exit Sleep
+    (ILI9341_DISPON,    b'',                         0),     # Display on
+)
+
+# Partial refresh tuning.  Every window costs a CASET/PASET/RAMWR sequence, so
+# two damaged rectangles are merged whenever their bounding box wastes fewer
+# pixels than this.  Once the damaged area exceeds the ratio of the panel a
+# single full frame write is cheaper than a set of windows.
+WINDOW_OVERHEAD_PIXELS  = 512
+FULL_FRAME_RATIO        = 0.6
+# Frames sent without damaged regions are compared with the last frame sent,
+# in square tiles of this size, and only the tiles that changed are written.
+DIFF_TILE_SIZE          = 16
+
 
 def color565(r, g, b):
     """Convert red, green, blue components to a 16-bit 565 RGB value. Components
@@ -105,14 +145,51 @@ def color565(r, g, b):
     """
     return ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
 
-def image_to_data(image):
-    """Generator function to convert a PIL image to 16-bit 565 RGB bytes."""
+def image_to_data(image, out=None):
+    """Convert a PIL image to 16-bit 565 RGB bytes.  The bytes are written into
+    out, a uint8 array of shape (height, width, 2), which is allocated when not
+    provided.  The array is returned and can be passed straight to the SPI
+    driver through the buffer protocol.  'P' and 'L' images are converted
+    through a lookup table of their palette.
+    """
     #NumPy is much faster at doing this. NumPy code provided by:
     #Keith (https://www.blogger.com/profile/02555547344016007163)
-    pb = np.array(image.convert('RGB')).astype('uint16')
+    if image.mode in ('P', 'L'):
+        # Paletted and greyscale images only need a lookup per pixel.
+        if image.mode == 'P':
+            palette = palette_to_data(bytes(image.getpalette('RGB')))
+        else:
+            palette = palette_to_data(GREYSCALE_PALETTE)
+        if out is None:
+            out = np.empty((image.height, image.width, 2), dtype=np.uint8)
+        np.take(palette, np.asarray(image), axis=0, out=out)
+        return out
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    pb = np.asarray(image)
+    if out is None:
+        out = np.empty((pb.shape[0], pb.shape[1], 2), dtype=np.uint8)
+    red, green, blue = pb[:,:,0], pb[:,:,1], pb[:,:,2]
+    high, low = out[:,:,0], out[:,:,1]
     #color = ((pb[:,:,0] & 0xF8) << 8) | ((pb[:,:,1] & 0xFC) << 3) | (pb[:,:,2] >> 3)
-    color = ((pb[:,:,2] & 0xF8) << 8) | ((pb[:,:,1] & 0xFC) << 3) | (pb[:,:,0] >> 3)
-    return np.dstack(((color >> 8) & 0xFF, color & 0xFF)).flatten().tolist()
+    # color = ((blue & 0xF8) << 8) | ((green & 0xFC) << 3) | (red >> 3), split into
+    # its two bytes so all the arithmetic stays in uint8 and in place.
+    np.bitwise_and(blue, 0xF8, out=high)
+    high |= green >> 5
+    np.left_shift(green, 3, out=low)
+    low &= 0xE0
+    low |= red >> 3
+    return out
+
+@functools.lru_cache(maxsize=16)
+def palette_to_data(palette):
+    """16-bit 565 RGB bytes of the 256 entries of a palette given as bytes of
+    RGB triplets, as a uint8 array of shape (256, 2).
+    """
+    palette = palette[:768].ljust(768, b'\x00')
+    return image_to_data(Image.frombytes('RGB', (256, 1), palette))[0]
+
+GREYSCALE_PALETTE = bytes(np.repeat(np.arange(256, dtype=np.uint8), 3))
 
 class ILI9341(object):
     """Representation of an ILI9341 TFT LCD."""
@@ -143,18 +220,48 @@ class ILI9341(object):
         spi.set_clock_hz(64000000)
         # Create an image buffer.
         self.buffer = Image.new('RGB', (width, height))
+        # Preallocated 16-bit 565 RGB copy of a full frame, reused by display().
+        self._frame = np.empty((height, width, 2), dtype=np.uint8)
+        # What the panel shows, in the same format, None while it is unknown.
+        self._sent = None
+        # Address window last set on the panel, see set_window().
+        self._window = None
+        # Background transfer thread, see start_worker().
+        self._worker = None
+        self._mailbox = threading.Condition()
+        self._pending = None
+        self._transferring = False
+        self.frames_dropped = 0
+        # Sequence numbers of the last frame handed to display() and of the
+        # last one written to the panel, a dropped frame is never written.
+        self.frames_queued = 0
+        self.frames_written = 0
+        # Regions of the buffer changed since the last display() call.
+        self._dirty = list()
+        # Bytes written to the bus so far and, if set, the profiler.FrameProfiler
+        # recording the conversion and transfer of every frame.
+        self.bytes_sent = 0
+        self.profiler = None
+        self._convert_seconds = 0.0
 
     def send(self, data, is_data=True, chunk_size=4096):
         """Write a byte or array of bytes to the display. Is_data parameter
         controls if byte should be interpreted as display data (True) or command
         data (False).  Chunk_size is an optional size of bytes to write in a
-        single SPI transaction, with a default of 4096.
+        single SPI transaction, with a default of 4096.  Objects supporting the
+        buffer protocol (bytes, bytearray, NumPy arrays) are written in bulk
+        without being copied into a list, the driver splits them as needed.
         """
         # Set DC low for command, high for data.
         self._gpio.output(self._dc, is_data)
         # Convert scalar argument to list so either can be passed as parameter.
         if isinstance(data, numbers.Number):
             data = [data & 0xFF]
+        if not isinstance(data, list):
+            self.bytes_sent += memoryview(data).nbytes
+            self._spi.write_buffer(data)
+            return
+        self.bytes_sent += len(data)
         # Write data a chunk at a time.
         for start in range(0, len(data), chunk_size):
             end = min(start+chunk_size, len(data))
@@ -178,96 +285,28 @@ class ILI9341(object):
             self._gpio.set_high(self._rst)
             time.sleep(0.150)
 
+    def write_command(self, command, parameters=b''):
+        """Write a command followed by its parameter bytes.  The command and
+        the parameters are sent in one SPI transaction each, however many
+        parameters there are.
+        """
+        self.send(bytes((command,)), False)
+        if len(parameters) > 0:
+            self.send(bytes(parameters), True)
+
+    def run_sequence(self, sequence):
+        """Write a table of (command, parameters, delay) entries, waiting
+        delay seconds after each command that has one.
+        """
+        for command, parameters, delay in sequence:
+            self.write_command(command, parameters)
+            if delay:
+                time.sleep(delay)
+
     def _init(self):
         # Initialize the display.  Broken out as a separate function so it can
         # be overridden by other displays in the future.
-        self.command(0xEF)
-        self.data(0x03)
-        self.data(0x80)
-        self.data(0x02)
-        self.command(0xCF)
-        self.data(0x00)
-        self.data(0XC1)
-        self.data(0X30)
-        self.command(0xED)
-        self.data(0x64)
-        self.data(0x03)
-        self.data(0X12)
-        self.data(0X81)
-        self.command(0xE8)
-        self.data(0x85)
-        self.data(0x00)
-        self.data(0x78)
-        self.command(0xCB)
-        self.data(0x39)
-        self.data(0x2C)
-        self.data(0x00)
-        self.data(0x34)
-        self.data(0x02)
-        self.command(0xF7)
-        self.data(0x20)
-        self.command(0xEA)
-        self.data(0x00)
-        self.data(0x00)
-        self.command(ILI9341_PWCTR1)    # Power control
-        self.data(0x23)                    # VRH[5:0]
-        self.command(ILI9341_PWCTR2)    # Power control
-        self.data(0x10)                    # SAP[2:0];BT[3:0]
-        self.command(ILI9341_VMCTR1)    # VCM control
-        self.data(0x3e)
-        self.data(0x28)
-        self.command(ILI9341_VMCTR2)    # VCM control2
-        self.data(0x86)                    # --
-        self.command(ILI9341_MADCTL)    #  Memory Access Control
-        self.data(0x48)
-        self.command(ILI9341_PIXFMT)
-        self.data(0x55)
-        self.command(ILI9341_FRMCTR1)
-        self.data(0x00)
-        self.data(0x18)
-        self.command(ILI9341_DFUNCTR)    #  Display Function Control
-        self.data(0x08)
-        self.data(0x82)
-        self.data(0x27)
-        self.command(0xF2)                #  3Gamma Function Disable
-        self.data(0x00)
-        self.command(ILI9341_GAMMASET)    # Gamma curve selected
-        self.data(0x01)
-        self.command(ILI9341_GMCTRP1)    # Set Gamma
-        self.data(0x0F)
-        self.data(0x31)
-        self.data(0x2B)
-        self.data(0x0C)
-        self.data(0x0E)
-        self.data(0x08)
-        self.data(0x4E)
-        self.data(0xF1)
-        self.data(0x37)
-        self.data(0x07)
-        self.data(0x10)
-        self.data(0x03)
-        self.data(0x0E)
-        self.data(0x09)
-        self.data(0x00)
-        self.command(ILI9341_GMCTRN1)    # Set Gamma
-        self.data(0x00)
-        self.data(0x0E)
-        self.data(0x14)
-        self.data(0x03)
-        self.data(0x11)
-        self.data(0x07)
-        self.data(0x31)
-        self.data(0xC1)
-        self.data(0x48)
-        self.data(0x08)
-        self.data(0x0F)
-        self.data(0x0C)
-        self.data(0x31)
-        self.data(0x36)
-        self.data(0x0F)
-        self.command(ILI9341_SLPOUT)    # Exit Sleep
-        time.sleep(0.120)
-        self.command(ILI9341_DISPON)    # Display on
+        self.run_sequence(ILI9341_INIT_SEQUENCE)
 
     def begin(self):
         """Initialize the display.  Should be called once before other calls that
@@ -275,6 +314,8 @@ class ILI9341(object):
         """
         self.reset()
         self._init()
+        self._sent = None
+        self._window = None
 
     def set_window(self, x0=0, y0=0, x1=None, y1=None):
         """Set the pixel address window for proceeding drawing commands. x0 and
@@ -287,41 +328,233 @@ class ILI9341(object):
             x1 = self.width-1
         if y1 is None:
             y1 = self.height-1
-        self.command(ILI9341_CASET)        # Column addr set
-        self.data(x0 >> 8)
-        self.data(x0)                    # XSTART
-        self.data(x1 >> 8)
-        self.data(x1)                    # XEND
-        self.command(ILI9341_PASET)        # Row addr set
-        self.data(y0 >> 8)
-        self.data(y0)                    # YSTART
-        self.data(y1 >> 8)
-        self.data(y1)                    # YEND
-        self.command(ILI9341_RAMWR)        # write to RAM
+        # The address window stays set until changed, consecutive writes to
+        # the same window only need a new RAMWR.
+        if self._window != (x0, y0, x1, y1):
+            self.write_command(ILI9341_CASET, struct.pack('>HH', x0, x1))     # Column addr set
+            self.write_command(ILI9341_PASET, struct.pack('>HH', y0, y1))     # Row addr set
+            self._window = (x0, y0, x1, y1)
+        self.write_command(ILI9341_RAMWR)       # write to RAM
+
+    def mark_dirty(self, xy):
+        """Report a region of the display buffer as changed since the last
+        display() call.  xy is a (x0, y0, x1, y1) box with the same meaning
+        as for Image.crop(), coordinates are rounded outwards to whole pixels
+        and clipped to the screen.
+        """
+        x0 = max(0, int(math.floor(min(xy[0], xy[2]))))
+        y0 = max(0, int(math.floor(min(xy[1], xy[3]))))
+        x1 = min(self.width,  int(math.ceil(max(xy[0], xy[2]))))
+        y1 = min(self.height, int(math.ceil(max(xy[1], xy[3]))))
+        if x1 > x0 and y1 > y0:
+            self._dirty.append((x0, y0, x1, y1))
+
+    def merge_regions(self, regions):
+        """Coalesce a list of damaged boxes into the set of windows to send.
+        Boxes are merged while their common bounding box wastes fewer pixels
+        than the cost of an extra window.  Returns a single full screen box if
+        the damaged area makes up most of the screen.
+        """
+        def area(box):
+            return (box[2] - box[0]) * (box[3] - box[1])
+
+        boxes = list(regions)
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(boxes)):
+                for j in range(i + 1, len(boxes)):
+                    a, b = boxes[i], boxes[j]
+                    union = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    if area(union) - area(a) - area(b) <= WINDOW_OVERHEAD_PIXELS:
+                        boxes[i] = union
+                        boxes.pop(j)
+                        merged = True
+                        break
+                if merged:
+                    break
+
+        if sum([area(box) for box in boxes]) > FULL_FRAME_RATIO * self.width * self.height:
+            return [(0, 0, self.width, self.height)]
+        return boxes
+
+    def changed_regions(self, frame):
+        """Compare frame, 16-bit 565 RGB data as returned by image_to_data(),
+        with the last frame sent and return the changed parts as boxes made of
+        whole tiles, one per run of changed tiles in a row of tiles.  The whole
+        screen is returned while the content of the panel is unknown.
+        """
+        if self._sent is None:
+            return [(0, 0, self.width, self.height)]
+        changed = np.any(frame != self._sent, axis=2)
+        tile = DIFF_TILE_SIZE
+        changed = np.logical_or.reduceat(changed, np.arange(0, self.height, tile), axis=0)
+        changed = np.logical_or.reduceat(changed, np.arange(0, self.width, tile), axis=1)
+        if changed.sum() > FULL_FRAME_RATIO * changed.size:
+            return [(0, 0, self.width, self.height)]
+
+        boxes = list()
+        for row in np.flatnonzero(changed.any(axis=1)):
+            # Runs of changed tiles start where the row steps up and end where it steps down.
+            steps = np.diff(np.concatenate(([0], changed[row].astype(np.int8), [0])))
+            for start, end in zip(np.flatnonzero(steps == 1), np.flatnonzero(steps == -1)):
+                boxes.append((int(start) * tile, int(row) * tile,
+                              min(int(end) * tile, self.width), min((int(row) + 1) * tile, self.height)))
+        return boxes
 
     def display(self, image=None):
         """Write the display buffer or provided image to the hardware.  If no
         image parameter is provided the display buffer will be written to the
         hardware.  If an image is provided, it should be RGB format and the
-        same dimensions as the display hardware.
+        same dimensions as the display hardware.  When regions were reported
+        with mark_dirty() only those parts of the image are sent, otherwise
+        the frame is compared with the last one sent and only the tiles that
+        changed are written, see changed_regions().  With the worker running
+        the write happens in the background, see start_worker().
         """
         # By default write the internal buffer to the display.
         if image is None:
             image = self.buffer
-        # Set address bounds to entire display.
-        self.set_window()
-        # Convert image to array of 16bit 565 RGB data bytes.
-        # Unfortunate that this copy has to occur, but the SPI byte writing
-        # function needs to take an array of bytes and PIL doesn't natively
-        # store images in 16-bit 565 RGB format.
-        pixelbytes = list(image_to_data(image))
-        # Write data to hardware.
-        self.data(pixelbytes)
+        regions = self._dirty
+        self._dirty = list()
+        page = None if self.profiler is None else self.profiler.page
+        self.frames_queued += 1
+        frame = self.frames_queued
+
+        if self._worker is None:
+            self._send_frame(image, regions, page, frame)
+            return
+
+        # Hand a snapshot over to the worker, the caller is free to draw the
+        # next frame into the buffer straight away.  A frame not picked up yet
+        # is replaced, its regions still have to be sent with the new one.
+        with self._mailbox:
+            if self._pending is not None:
+                self.frames_dropped += 1
+                pending_regions = self._pending[1]
+                if len(pending_regions) == 0 or len(regions) == 0:
+                    regions = list()
+                else:
+                    regions = pending_regions + regions
+            self._pending = (image.copy(), regions, page, frame)
+            self._mailbox.notify_all()
+
+    def start_worker(self):
+        """Move the SPI transfers to a background thread.  From then on
+        display() returns as soon as the frame is queued.  Only the newest
+        frame waiting for the bus is kept, older ones are dropped.
+        """
+        if self._worker is not None:
+            return
+        self._worker = threading.Thread(target=self._run_worker, name='ILI9341', daemon=True)
+        self._worker.start()
+
+    def stop_worker(self):
+        """Send the frame still waiting, then stop the background thread."""
+        if self._worker is None:
+            return
+        worker = self._worker
+        with self._mailbox:
+            self._worker = None
+            self._mailbox.notify_all()
+        worker.join()
+
+    def close(self):
+        """Send the frame still waiting, stop the worker and close the SPI bus."""
+        self.stop_worker()
+        self._spi.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def flush(self, timeout=None):
+        """Block until the frames handed to the worker are on the screen.
+        Returns False if the timeout (in seconds) expired first.
+        """
+        with self._mailbox:
+            return self._mailbox.wait_for(lambda: self._pending is None and not self._transferring, timeout)
+
+    def _run_worker(self):
+        while True:
+            with self._mailbox:
+                self._mailbox.wait_for(lambda: self._pending is not None or self._worker is None)
+                if self._pending is None:
+                    return
+                image, regions, page, frame = self._pending
+                self._pending = None
+                self._transferring = True
+            try:
+                self._send_frame(image, regions, page, frame)
+            finally:
+                with self._mailbox:
+                    self._transferring = False
+                    self._mailbox.notify_all()
+
+    def _send_frame(self, image, regions, page, frame):
+        # Write a frame, timed for the profiler when there is one.
+        if self.profiler is None:
+            self._write_frame(image, regions)
+            self.frames_written = frame
+            return
+        self._convert_seconds = 0.0
+        bytes_sent = self.bytes_sent
+        start = time.perf_counter()
+        self._write_frame(image, regions)
+        elapsed = time.perf_counter() - start
+        self.frames_written = frame
+        self.profiler.frame_sent(page, convert_ms=self._convert_seconds * 1000,
+                                 spi_ms=(elapsed - self._convert_seconds) * 1000,
+                                 spi_bytes=self.bytes_sent - bytes_sent)
+
+    def _convert(self, image, out=None):
+        # image_to_data(), with the time it takes added up for the profiler.
+        start = time.perf_counter()
+        try:
+            return image_to_data(image, out)
+        finally:
+            self._convert_seconds += time.perf_counter() - start
+
+    def _write_frame(self, image, regions):
+        # Send the damaged regions of image.  If none are known the whole frame
+        # is converted and compared with the last one sent to find them.
+        if len(regions) == 0:
+            # Unfortunate that this copy has to occur, but PIL doesn't natively
+            # store images in 16-bit 565 RGB format.  Full frames are converted
+            # into the preallocated buffer.
+            frame = self._convert(image, self._frame)
+            for x0, y0, x1, y1 in self.merge_regions(self.changed_regions(frame)):
+                self.set_window(x0, y0, x1 - 1, y1 - 1)
+                if (x0, y0, x1, y1) == (0, 0, self.width, self.height):
+                    self.data(frame)
+                else:
+                    self.data(np.ascontiguousarray(frame[y0:y1, x0:x1]))
+            # The panel now shows frame, the old copy becomes the next buffer.
+            if self._sent is None:
+                self._sent = np.empty_like(frame)
+            self._sent, self._frame = frame, self._sent
+            return
+
+        for x0, y0, x1, y1 in self.merge_regions(regions):
+            # Set address bounds to the damaged window.
+            self.set_window(x0, y0, x1 - 1, y1 - 1)
+            # Convert image to array of 16bit 565 RGB data bytes.
+            if (x0, y0, x1, y1) == (0, 0, self.width, self.height):
+                pixelbytes = self._convert(image, self._frame)
+            else:
+                pixelbytes = self._convert(image.crop((x0, y0, x1, y1)))
+            # Write data to hardware.
+            self.data(pixelbytes)
+            if self._sent is not None:
+                self._sent[y0:y1, x0:x1] = pixelbytes
 
     def clear(self, color=(0,0,0)):
         """Clear the image buffer to the specified RGB color (default black)."""
         width, height = self.buffer.size
-        self.buffer.putdata([color]*(width*height))
+        self.buffer.paste(color, (0, 0, width, height))
+        self._dirty = list()
 
     def draw(self):
         """Return a PIL ImageDraw instance for 2D drawing on the image buffer."""
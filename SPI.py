@@ -20,7 +20,11 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import spidev
+try:
+    import spidev
+except ImportError:
+    # Not running on a Raspberry Pi, only the headless display backends are usable.
+    spidev = None
 
 MSBFIRST = 0
 LSBFIRST = 1
@@ -33,7 +37,8 @@ class SpiDev(object):
         identify the device, for example the device /dev/spidev1.0 would be port
         1 and device 0.
         """
-        
+        if spidev is None:
+            raise RuntimeError('spidev is not available on this platform.')
         self._device = spidev.SpiDev()
         self._device.open(port, device)
         self._device.max_speed_hz=max_speed_hz
@@ -77,6 +82,20 @@ class SpiDev(object):
         """
         self._device.writebytes(data)
 
+    def write_buffer(self, data):
+        """Half-duplex SPI write of a bytes-like object (bytes, bytearray,
+        memoryview or a contiguous NumPy uint8 array).  The data is passed to
+        the driver through the buffer protocol, without an intermediate list,
+        and split into transactions by spidev itself.
+        """
+        if hasattr(self._device, 'writebytes2'):
+            self._device.writebytes2(data)
+        else:
+            # Older spidev releases only accept lists of at most 4096 bytes.
+            view = memoryview(data).cast('B')
+            for start in range(0, len(view), 4096):
+                self._device.writebytes(view[start:start+4096].tolist())
+
     def read(self, length):
         """Half-duplex SPI read.  The specified length of bytes will be clocked
         in the MISO line and returned as a bytearray object.
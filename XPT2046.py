@@ -16,6 +16,9 @@ class Touch(object):
     GET_BATTERY = 0b10100000  # Battery monitor
     GET_AUX = 0b11100000  # Auxiliary input to ADC
 
+    Z1_THRESHOLD = 64  # Z1 below this, the panel is not pressed
+    PRESSURE_THRESHOLD = 300  # Samples pressed lighter than this are rejected
+
     def __init__(self, spi: SPI.SpiDev):
         """Initialize touch screen controller.
 
@@ -46,7 +49,9 @@ class Touch(object):
                     return (meanx, meany)
             # get a new value
             sample = self.raw_touch()  # get a touch
-            if sample is None:
+            if sample is None and nsamples == 0:
+                return None     # Not pressed, or released
+            elif sample is None:
                 nsamples = 0    # Invalidate buff
             else:
                 buff[buffptr] = sample  # put in buff
@@ -58,7 +63,40 @@ class Touch(object):
         return None
 
 
+    def is_pressed(self, z1=None):
+        """Check whether the panel is pressed with a single Z1 transfer.
+
+        Args:
+            z1 (int):  Z1 reading already taken, read when not given
+
+        """
+        if z1 is None:
+            z1 = self.send_command(self.GET_Z1)
+        return z1 >= self.Z1_THRESHOLD
+
+
+    def pressure(self, z1=None):
+        """Measure the touch pressure, higher is harder, 0 when not pressed.
+
+        Args:
+            z1 (int):  Z1 reading already taken, read again when not given
+
+        """
+        if z1 is None:
+            z1 = self.send_command(self.GET_Z1)
+        z2 = self.send_command(self.GET_Z2)
+        return max(0, z1 + 4095 - z2)
+
+
     def raw_touch(self):
+        """Read X and Y, or return None without reading them if the panel is
+        not pressed (one transfer) or pressed too lightly for a reliable
+        sample (two transfers)."""
+        z1 = self.send_command(self.GET_Z1)
+        if not self.is_pressed(z1):
+            return None
+        if self.pressure(z1) < self.PRESSURE_THRESHOLD:
+            return None
 
         x = self.send_command(self.GET_X)
         y = self.send_command(self.GET_Y)
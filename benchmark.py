@@ -0,0 +1,190 @@
+"""Rendering benchmark for the ScreenManager pages.
+
+Drives every page with representative data on the headless display backend and
+reports, per page, the PIL drawing time, the RGB565 conversion time and the
+bytes that would go over SPI, as JSON.
+
+    python benchmark.py --frames 50 --output benchmark.json
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+import ILI9341 as TFT
+from screen import ScreenManager
+from datatypes import DataContainer, WorkoutProgram, WorkoutSegment, CSV_headers
+
+TARGET_FPS = 4
+
+
+class PhaseTimer:
+    """Accumulates the time spent in the functions it wraps"""
+
+    def __init__(self) -> None:
+        self.elapsed = 0.0
+
+    def wrap(self, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.elapsed += time.perf_counter() - start
+        return timed
+
+
+def make_program(name: str, no_segments: int) -> WorkoutProgram:
+    program = WorkoutProgram()
+    program.name = name
+    program.segments = [WorkoutSegment("Power", 60 + (i % 5) * 30, 100 + (i * 37) % 200) for i in range(no_segments)]
+    return program
+
+
+def make_ride(duration: int) -> list:
+    """One CSV row per second, as read back by the history page"""
+    rows = list()
+    for t in range(duration):
+        power = 180 + 60 * ((t // 300) % 3) + random.randint(-25, 25)
+        row = {"T": str(t), "Cadence": str(85 + random.randint(-5, 5)), "Power": str(power),
+               "HR BPM": str(120 + (t * 40) // duration + random.randint(-3, 3)), "HR Zone": "Aerobic",
+               "Gradient": "0", "Speed": str(round(30 + random.uniform(-3, 3), 1)),
+               "Distance": str(round(t * 30 / 3600, 2)), "Energy": str(round(t * power / 1000)), "Time": str(t)}
+        rows.append(row)
+    return rows
+
+
+def make_history(no_workouts: int) -> list:
+    history = list()
+    for i in range(no_workouts):
+        duration = 1800 + i * 600
+        history.append({"Filename": "Workout-" + str(i) + ".csv", "Name": "24 01 " + str(10 + i) + " at 18:00",
+                        "Program": "Sweet spot intervals " + str(i),
+                        "Averages": {key: "150" for key in CSV_headers},
+                        "Max": dict({key: "300" for key in CSV_headers}, Time=str(duration), Energy=str(duration * 0.2))})
+    return history
+
+
+def workout_frame(lcd: ScreenManager, program: WorkoutProgram, workout_type: str = "Program", frame_seconds: float = 1):
+    """frame(i) draws the workout page frame_seconds * i into the workout. The workout manager keeps
+    the time as a float, a fraction of a second makes the frames use it the same way"""
+    container = DataContainer()
+    container.workoutDuration = sum(segment.duration for segment in program.segments)
+    container.currentSegment = program.segments[0]
+    parameters = program.getParameters()
+
+    def frame(i: int):
+        lcd.assignDataContainer(container)
+        container.workoutTime = i * frame_seconds
+        container.currentSegment.elapsedTime = i % container.currentSegment.duration
+        container.momentary.power = 200 + random.randint(-30, 30)
+        container.momentary.cadence = 85 + random.uniform(-5, 5)
+        container.momentary.heartRate = 140 + random.randint(-3, 3)
+        container.momentary.speed = 30 + random.uniform(-2, 2)
+        container.momentary.hrZone = "Tempo"
+        container.updateAveragesAndMaximums()
+        lcd.drawPageWorkout(workout_type, workout_type.upper(), parameters, 100, i % len(program.segments), 80)
+    return frame
+
+
+def pages(lcd: ScreenManager) -> dict:
+    """Name and frame function of every benchmarked page, frame(i) draws the i-th frame"""
+
+    programs = [make_program("Program " + str(i), 10 + 5 * i) for i in range(4)]
+    history = make_history(12)
+    ride = make_ride(3 * 60 * 60)
+    metadata = dict(history[-1], Max=dict(history[-1]["Max"], Time=str(len(ride))))
+
+    return {
+        "drawPageWorkout": workout_frame(lcd, make_program("30 segments", 30)),
+        "drawPageWorkout_float_time": workout_frame(lcd, make_program("30 segments", 30), frame_seconds = 1 / TARGET_FPS + 0.01),
+        "drawProgramSelector": lambda i: lcd.drawProgramSelector([program.getParameters() for program in programs],
+                                                                 previousEnabled = i % 2 == 1, nextEnabled = True),
+        "drawPageHistory": lambda i: lcd.drawPageHistory(history, len(history) - 1 - i % (len(history) - 2)),
+        "draw_page_historical_record_details": lambda i: lcd.draw_page_historical_record_details(metadata, ride, "Power", "HR BPM"),
+        "drawStringEditor": lambda i: lcd.drawStringEditor("workout no" + str(i)),
+        "drawPageMainMenu": lambda i: lcd.drawPageMainMenu(lcd.COLOUR_HEART if i % 2 else lcd.COLOUR_BG_LIGHT, lcd.COLOUR_TT, 80),
+    }
+
+
+def summary(samples: list) -> dict:
+    samples = sorted(samples)
+    return {"mean": round(statistics.fmean(samples), 3),
+            "median": round(statistics.median(samples), 3),
+            "p95": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3),
+            "max": round(samples[-1], 3)}
+
+
+def run(frames: int, spi_hz: int, selected: list = None) -> dict:
+    random.seed(0)
+    lcd = ScreenManager(backend = "memory")
+    lcd.display.stop_worker()   # transfers run inline, so each phase can be timed on its own
+    panel = lcd.display.panel
+    spi_hz = panel.clock_hz if spi_hz is None else spi_hz
+
+    convert = PhaseTimer()
+    write   = PhaseTimer()
+    image_to_data = TFT.image_to_data
+    TFT.image_to_data = convert.wrap(image_to_data)
+    lcd.display._write_frame = write.wrap(lcd.display._write_frame)
+
+    results = dict()
+    try:
+        for name, frame in pages(lcd).items():
+            if selected and name not in selected:
+                continue
+            lcd.refresh()   # the first frame of every page is a full one, as when navigating to it
+
+            samples = {"draw_ms": [], "convert_ms": [], "spi_bytes": [], "spi_transactions": [], "spi_ms": [], "frame_ms": []}
+            for i in range(frames + 1):
+                convert.elapsed = write.elapsed = 0.0
+                panel.reset_counters()
+
+                start = time.perf_counter()
+                frame(i)
+                total = time.perf_counter() - start
+
+                if i == 0:
+                    first_frame_ms = total * 1000   # includes building the caches of the page
+                    continue
+
+                draw_ms = (total - write.elapsed) * 1000
+                convert_ms = convert.elapsed * 1000
+                spi_ms = panel.bytes_written * 8 / spi_hz * 1000
+                samples["draw_ms"].append(draw_ms)
+                samples["convert_ms"].append(convert_ms)
+                samples["spi_bytes"].append(panel.bytes_written)
+                samples["spi_transactions"].append(panel.transactions)
+                samples["spi_ms"].append(spi_ms)
+                samples["frame_ms"].append(draw_ms + convert_ms + spi_ms)
+
+            result = {key: summary(values) for key, values in samples.items()}
+            result["first_frame_ms"] = round(first_frame_ms, 3)
+            result["fps"] = round(1000 / result["frame_ms"]["mean"], 1)
+            result["meets_target"] = result["fps"] >= TARGET_FPS
+            results[name] = result
+    finally:
+        TFT.image_to_data = image_to_data
+
+    return {"machine": platform.machine(), "python": platform.python_version(), "frames": frames,
+            "spi_hz": spi_hz, "target_fps": TARGET_FPS, "pages": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark the rendering of the ScreenManager pages")
+    parser.add_argument("--frames", type = int, default = 20, help = "frames measured per page, after one warm-up frame")
+    parser.add_argument("--spi-hz", type = int, default = None, help = "SPI clock used to estimate transfer times, defaults to the driver's")
+    parser.add_argument("--page", action = "append", help = "benchmark only this page, can be repeated")
+    parser.add_argument("--output", help = "write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = run(args.frames, args.spi_hz, args.page)
+    if args.output:
+        with open(args.output, "wt") as file:
+            json.dump(report, file, indent = 2)
+    else:
+        json.dump(report, sys.stdout, indent = 2)
+        print()
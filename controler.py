@@ -12,22 +12,40 @@ import fcntl
 import time
 import shutil
 from   workouts    import WorkoutManager
-from   BLE_Device  import HeartRateMonitor, FitnessMachine
+from   BLE_Device  import HeartRateMonitor, FitnessMachine, ConnectionManager
 from   datatypes   import DataContainer, UserList, QueueEntry, WorkoutSegment, CSV_headers
-from   screen      import ScreenManager, TouchScreen
+from   screen      import ScreenManager, TouchScreen, TouchIndex
 from   mqtt        import MQTT_Exporter
+from   profiler    import FrameProfiler
+from   touch_recorder import TouchRecorder
 
 
 
+#####    Reading configuration file    ####
+
+config = configparser.ConfigParser()
+
+try:
+    config.read("config.ini")
+except:
+    raise Exception("Config files damaged / not available")
+
+#### services of the paired BLE devices, kept in the working directory next to config.ini like the other data files
+BLE_CACHE_PATH = os.path.join(os.getcwd(), "ble_cache.json")
+
+
 userList               = UserList()
 dataAndFlagContainer   = DataContainer()
 device_heartRateSensor = HeartRateMonitor()
 device_turboTrainer    = FitnessMachine()
-workoutManager         = WorkoutManager()
-lcd                    = ScreenManager()
-touchScreen            = TouchScreen()
+profiler               = FrameProfiler(config.getint("Profiler", "window", fallback = 200)) if config.getboolean("Profiler", "enabled", fallback = False) else None
 mqtt                   = MQTT_Exporter()
 
+####    Built by setup(), they use the hardware of the device    ####
+workoutManager: WorkoutManager = None
+lcd: ScreenManager             = None
+touchScreen: TouchScreen       = None
+
 
 def scanUserHistory(userName):
     path = os.getcwd() + "/Workouts/" + userName
@@ -90,35 +108,41 @@ def scanUserHistory(userName):
 #####    Main Program functions here    ####
 
 class Supervisor:
-    def __init__(self) -> None:
+    def __init__(self, battery_gauge: bool = True, panel_size: tuple = (320, 240)) -> None:
         self.queue = queue.SimpleQueue()
         self.state: str = "UserChange"
         self.activeUserID = 0
         self.sleepDuration = 0.02
+        self.touchIndex: TouchIndex = None      #### hit-test index of self.touchActiveRegions, built when they are set
+        self.panel_size = panel_size            #### width and height of the screen the touch regions are on
+        self.recorder: TouchRecorder = None     #### records the touches handled by touchTester(), see touch_replay.py
         self.USBPATH = "/media/usb"
         self.wifi_ssid: str = None
         self.wifi_password: str = None
         self.wifi_status = "Unknown"
         
-        MCP3021_I2CADDR = 0x4f
-        I2C_SLAVE_COMMAND = 0x0703  #### Tells the OS this is an I2C Slave device
+        self.I2C_File = None        #### battery gauge, None without one
+        if battery_gauge:
+            MCP3021_I2CADDR = 0x4f
+            I2C_SLAVE_COMMAND = 0x0703  #### Tells the OS this is an I2C Slave device
 
-        self.I2C_File =  io.open("/dev/i2c-0", "rb", buffering=0)
+            self.I2C_File =  io.open("/dev/i2c-0", "rb", buffering=0)
 
-        # set device address
-        fcntl.ioctl(self.I2C_File, I2C_SLAVE_COMMAND, MCP3021_I2CADDR)
+            # set device address
+            fcntl.ioctl(self.I2C_File, I2C_SLAVE_COMMAND, MCP3021_I2CADDR)
 
 
-    def isInsideBoundaryBox(self, touchPoint: tuple, boundaryBox: tuple):
-        
-        x_touch, y_touch = touchPoint
-        x1_box, y1_box, x2_box, y2_box = boundaryBox
+    @property
+    def touchActiveRegions(self) -> tuple:
+        return None if self.touchIndex is None else self.touchIndex.regions
 
-        if x_touch >= x1_box and x_touch <= x2_box:
-            if y_touch >= y1_box and y_touch <= y2_box:
-                return True
-            
-        return False
+    @touchActiveRegions.setter
+    def touchActiveRegions(self, regions: tuple) -> None:
+        #### the index is rebuilt only when the page has changed its regions
+        if regions is None:
+            self.touchIndex = None
+        elif self.touchIndex is None or self.touchIndex.regions != regions:
+            self.touchIndex = TouchIndex(regions, *self.panel_size)
 
     async def programSelector(self) -> int:
         print("state: Program Selector method")
@@ -181,6 +205,9 @@ class Supervisor:
             return ssid_list
 
     def read_battery_SOC(self) -> int:
+        """State of charge in %, None without a battery gauge"""
+        if self.I2C_File is None:
+            return None
 
         # Read ADC (0-1023
         adc_reading = 0
@@ -235,33 +262,35 @@ class Supervisor:
     async def state_calibrate(self):
         print("state: state Calibrate method")
         
-        point1 = (20,20)
-        point2 = (300,220)
+        #### corners and one more point, away from the instructions in the middle of the screen
+        requestedPoints = ((20,20), (300,20), (300,220), (20,220), (160,190))
+        measuredPoints = list()
+        PROMPT_INTERVAL = 10        #### seconds without a touch before the target is drawn again
         
-        measuredP1 = None
-        measuredP2 = None
-        
-        lcd.drawPageCalibration(point1)
+        lcd.drawPageCalibration(requestedPoints[0])
                 
         while self.state == "Calibrate":
-            touch, location = touchScreen.checkTouch()
-            if touch == True:
-                print("Touch! ", location)
-                if measuredP1 is None: # first point 
-                    measuredP1 = location
-                    lcd.drawPageCalibration(point2)
+            event = await touchScreen.next_event(timeout = PROMPT_INTERVAL)
+            if event is None:
+                print("Calibration: no touch, showing the target again")
+                lcd.drawPageCalibration(requestedPoints[len(measuredPoints)])
+            elif event.type == "Press":
+                print("Touch! ", event.location, event.raw)
+                measuredPoints.append(event.raw)
+                if len(measuredPoints) < len(requestedPoints):
+                    lcd.drawPageCalibration(requestedPoints[len(measuredPoints)])
                     await asyncio.sleep(1.0)
 
                 else:
-                    measuredP2 = location
-                    # both points acquired,  now do the calculation:
-                    calibration = touchScreen.calculateCalibrationConstants(requestedPoints=(point1, point2),
-                                                                            measuredPoints= (measuredP1, measuredP2))
-                            
-                    config.set("TouchScreen", "x_multiplier", str(calibration[0]))
-                    config.set("TouchScreen", "x_offset",     str(calibration[1]))
-                    config.set("TouchScreen", "y_multiplier", str(calibration[2]))
-                    config.set("TouchScreen", "y_offset",     str(calibration[3]))
+                    # all points acquired,  now do the calculation:
+                    calibration = touchScreen.calculateCalibrationConstants(requestedPoints=requestedPoints,
+                                                                            measuredPoints=measuredPoints)
+                    
+                    if not config.has_section("TouchScreen"):
+                        config.add_section("TouchScreen")
+                    for option in ("x_multiplier", "x_offset", "y_multiplier", "y_offset"):     #### replaced by the affine transform
+                        config.remove_option("TouchScreen", option)
+                    config.set("TouchScreen", "affine", ", ".join([str(coefficient) for coefficient in calibration]))
                             
                     with open('config.ini', 'wt') as file:
                         config.write(file)
@@ -269,8 +298,6 @@ class Supervisor:
                     lcd.drawMessageBox("Calibration applied!", ("OK",))
                     self.state = "MainMenu"
                     await asyncio.sleep(3)
-
-            await asyncio.sleep(self.sleepDuration)
     
     async def state_discover(self) -> None:
 
@@ -983,16 +1010,18 @@ class Supervisor:
     async def touchTester(self, callback, timeout:float=None) -> bool:
         t1 = time.time()
         while True if timeout is None else time.time()-t1 < timeout: 
-            touch, location = touchScreen.checkTouch()
-            if touch == True:
+            #### touch events are debounced by the sampler, one "Press" per touch
+            remaining = None if timeout is None else max(0, timeout - (time.time()-t1))
+            event = await touchScreen.next_event(remaining)
+            if event is not None and event.type == "Press":
+                location = event.location
                 print("Touch! ", location)
-                for region in self.touchActiveRegions:
-                    boundary, value = region    #### unpack the tuple containing the area xy tuple and the value
-                    if self.isInsideBoundaryBox(touchPoint=location, boundaryBox=boundary):
-                        if await callback(value) == True: 
-                            return True
-                await asyncio.sleep(0.5)    ## Deadzone for touch
-            await asyncio.sleep(self.sleepDuration)
+                value = None if self.touchIndex is None else self.touchIndex.hit(location)
+                if self.recorder is not None:
+                    self.recorder.record(event, self.state, value, lcd.display.frames_queued)
+                if value is not None:
+                    if await callback(value) == True: 
+                        return True
         return False
 
 
@@ -1056,81 +1085,93 @@ class Supervisor:
         print("End of main loop")
 
 
-supervisor = Supervisor()
+supervisor: Supervisor = None
 
-#####    Reading configuration file    ####
 
-config = configparser.ConfigParser()
+def setup(touch: TouchScreen = None, display_options: dict = None, on_device: bool = True) -> None:
+    """Builds the workout manager, the display, the touch screen and the Supervisor as configured in config.ini.
+    touch replaces the calibrated touch panel and display_options the [Display] section. Off the device there
+    is no buzzer and no battery gauge, see touch_replay.py."""
+    global workoutManager, lcd, touchScreen, supervisor
 
-try:
-    config.read("config.ini")
-except:
-    raise Exception("Config files damaged / not available")
+    if display_options is None:
+        display_options = config["Display"] if config.has_section("Display") else dict()
 
+    workoutManager = WorkoutManager(buzzer_pin = 16 if on_device else None)
+    lcd            = ScreenManager(profiler = profiler, overlay = config.getboolean("Profiler", "overlay", fallback = False),
+                                   **display_options)
+    touchScreen    = TouchScreen(irq_pin = config.getint("TouchScreen", "irq_pin", fallback = None)) if touch is None else touch
+    supervisor     = Supervisor(battery_gauge = on_device, panel_size = (lcd.WIDTH, lcd.HEIGHT))
 
+    if touch is None:
+        try:
+            if config.has_option("TouchScreen", "affine"):
+                touchScreen.setAffineCalibration([float(coefficient) for coefficient in config["TouchScreen"]["affine"].split(",")])
+            else:
+                x_multiplier = float(config["TouchScreen"]["X_Multiplier"])
+                x_offset =     float(config["TouchScreen"]["X_Offset"])
+                y_multiplier = float(config["TouchScreen"]["Y_Multiplier"])
+                y_offset =     float(config["TouchScreen"]["Y_Offset"])
 
-try:
-    x_multiplier = float(config["TouchScreen"]["X_Multiplier"])
-    x_offset =     float(config["TouchScreen"]["X_Offset"])
-    y_multiplier = float(config["TouchScreen"]["Y_Multiplier"])
-    y_offset =     float(config["TouchScreen"]["Y_Offset"])
+                touchScreen.setCalibration(x_multiplier, x_offset, y_multiplier, y_offset)
 
-    touchScreen.setCalibration(x_multiplier, x_offset, y_multiplier, y_offset)
+        except:
+            supervisor.state = "TurboTrainer"
+            asyncio.run(supervisor.state_calibrate())
 
-except:
-    supervisor.state = "TurboTrainer"
-    asyncio.run(supervisor.state_calibrate())
+    try:
+        device_heartRateSensor.address = config["HeartRateSensor"]["Address"]
+        device_heartRateSensor.name    = config["HeartRateSensor"]["Sensor_Name"]
+    except:
+        supervisor.state = "HeartRateSensor"
+        asyncio.run(supervisor.state_discover())
 
-try:
-    device_heartRateSensor.address = config["HeartRateSensor"]["Address"]
-    device_heartRateSensor.name    = config["HeartRateSensor"]["Sensor_Name"]
-except:
-    supervisor.state = "HeartRateSensor"
-    asyncio.run(supervisor.state_discover())
+    try:
+        device_turboTrainer.address = config["TurboTrainer"]["Address"]
+        device_turboTrainer.name    = config["TurboTrainer"]["Sensor_Name"]
+    except:
+        supervisor.state = "TurboTrainer"
+        asyncio.run(supervisor.state_discover())
 
-try:
-    device_turboTrainer.address = config["TurboTrainer"]["Address"]
-    device_turboTrainer.name    = config["TurboTrainer"]["Sensor_Name"]
-except:
-    supervisor.state = "TurboTrainer"
-    asyncio.run(supervisor.state_discover())
+    try:
+        mqtt.broker   = config["MQTT"]["broker"]
+        mqtt.port = int(config["MQTT"]["port"])
+        mqtt.username = config["MQTT"]["username"]
+        if mqtt.username == "None":
+            mqtt.username = None
+        mqtt.password = config["MQTT"]["password"]
+        if mqtt.password == "None":
+            mqtt.password = None
+        mqtt.client_id =config["MQTT"]["client_id"]
+        mqtt.topic     =config["MQTT"]["topic"]
+    except:
+        pass
 
-try:
-    mqtt.broker   = config["MQTT"]["broker"]
-    mqtt.port = int(config["MQTT"]["port"])
-    mqtt.username = config["MQTT"]["username"]
-    if mqtt.username == "None":
-        mqtt.username = None
-    mqtt.password = config["MQTT"]["password"]
-    if mqtt.password == "None":
-        mqtt.password = None
-    mqtt.client_id =config["MQTT"]["client_id"]
-    mqtt.topic     =config["MQTT"]["topic"]
-except:
-    pass
+    if config.has_option("TouchScreen", "record"):
+        supervisor.recorder = TouchRecorder(config["TouchScreen"]["record"])
 
-try:
-    supervisor.wifi_ssid = config["WIFI"]["ssid"]
-    supervisor.wifi_password = config["WIFI"]["password"]
-except:
-    pass
+    try:
+        supervisor.wifi_ssid = config["WIFI"]["ssid"]
+        supervisor.wifi_password = config["WIFI"]["password"]
+    except:
+        pass
 
 
 async def main():
    
-    lock = asyncio.Lock()
+    connectionManager = ConnectionManager((device_heartRateSensor, device_turboTrainer), cache_path = BLE_CACHE_PATH)
     supervisor.state = "UserChange"
 
     await asyncio.gather(
-        device_heartRateSensor.connection_to_BLE_Device(lock, dataAndFlagContainer),
-        device_turboTrainer.   connection_to_BLE_Device(lock, dataAndFlagContainer),
-        supervisor.loopy(lock),
+        connectionManager.run(dataAndFlagContainer),
+        supervisor.loopy(connectionManager.scanLock),
         workoutManager.run(device_turboTrainer, dataAndFlagContainer)
     )
 
 
 ####    Trigger Main    ####
 if __name__ == "__main__":
+    setup()
     asyncio.run(main())
     
 
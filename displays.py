@@ -0,0 +1,213 @@
+"""Display backends. The ILI9341 TFT on the SPI bus is used on the device, the
+headless backends render the same frames in memory, to a PNG file or to a Linux
+framebuffer so the screens can be run and profiled on any machine."""
+import os
+
+import numpy as np
+from PIL import Image
+
+import GPIO
+import ILI9341 as TFT
+
+
+class VirtualPanel(GPIO.BaseGPIO):
+    """Stands in for both the SPI bus and the GPIO of an ILI9341.  Commands and
+    pixel data written by the driver are decoded into an RGB565 frame buffer,
+    and every transfer is counted so the bytes a frame costs over SPI are known.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.frame = np.zeros((height, width, 2), dtype=np.uint8)
+        self.bytes_written = 0
+        self.transactions = 0
+        self.clock_hz = 0
+        self._is_data = True
+        self._command = None
+        self._params = bytearray()
+        self._window = (0, 0, width-1, height-1)
+        self._position = 0
+
+    # GPIO side, only the level of the D/C line matters.
+    def setup(self, pin, mode, pull_up_down=GPIO.PUD_OFF):
+        pass
+
+    def output(self, pin, value):
+        self._is_data = bool(value)
+
+    def input(self, pin):
+        return GPIO.HIGH
+
+    # SPI side.
+    def set_clock_hz(self, hz):
+        self.clock_hz = hz
+
+    def set_mode(self, mode):
+        pass
+
+    def set_bit_order(self, order):
+        pass
+
+    def close(self):
+        pass
+
+    def write(self, data):
+        self.write_buffer(bytes(data))
+
+    def write_buffer(self, data):
+        data = memoryview(data).cast('B')
+        self.bytes_written += len(data)
+        self.transactions += 1
+
+        if not self._is_data:
+            for byte in data:
+                self._command = byte
+                self._params = bytearray()
+                if byte == TFT.ILI9341_RAMWR:
+                    self._position = 0
+            return
+
+        if self._command in (TFT.ILI9341_CASET, TFT.ILI9341_PASET):
+            self._params += data
+            if len(self._params) >= 4:
+                start = (self._params[0] << 8) | self._params[1]
+                end   = (self._params[2] << 8) | self._params[3]
+                x0, y0, x1, y1 = self._window
+                if self._command == TFT.ILI9341_CASET:
+                    self._window = (start, y0, end, y1)
+                else:
+                    self._window = (x0, start, x1, end)
+                self._params = bytearray()
+        elif self._command == TFT.ILI9341_RAMWR:
+            self._write_pixels(np.frombuffer(data, dtype=np.uint8).reshape(-1, 2))
+
+    def _write_pixels(self, pixels):
+        # Fill the address window row by row, wrapping around like the controller does.
+        x0, y0, x1, y1 = self._window
+        width, height = x1 - x0 + 1, y1 - y0 + 1
+        if self._position == 0 and len(pixels) == width * height:
+            self.frame[y0:y1+1, x0:x1+1] = pixels.reshape(height, width, 2)
+        else:
+            index = np.arange(self._position, self._position + len(pixels)) % (width * height)
+            self.frame[y0 + index // width, x0 + index % width] = pixels
+        self._position += len(pixels)
+
+    def read(self, length):
+        return bytearray(length)
+
+    def transfer(self, data):
+        self.write(data)
+        return bytearray(len(data))
+
+    def reset_counters(self):
+        self.bytes_written = 0
+        self.transactions = 0
+
+    def image(self):
+        """Return what the panel shows as an RGB PIL image."""
+        value = (self.frame[:,:,0].astype(np.uint16) << 8) | self.frame[:,:,1]
+        # image_to_data() sends blue in the high bits, see ILI9341.image_to_data().
+        rgb = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        rgb[:,:,0] = (value & 0x1F) << 3
+        rgb[:,:,1] = ((value >> 5) & 0x3F) << 2
+        rgb[:,:,2] = (value >> 11) << 3
+        return Image.fromarray(rgb, 'RGB')
+
+
+class HeadlessDisplay(TFT.ILI9341):
+    """ILI9341 driver writing to a VirtualPanel in memory.  The whole driver runs,
+    windowed writes and the background worker included, only the bus is virtual.
+    """
+
+    def __init__(self, width=TFT.ILI9341_TFTWIDTH, height=TFT.ILI9341_TFTHEIGHT):
+        self.panel = VirtualPanel(width, height)
+        super().__init__(dc=0, spi=self.panel, gpio=self.panel, width=width, height=height)
+
+    def snapshot(self):
+        """Return the image currently shown by the panel."""
+        return self.panel.image()
+
+
+class PNGDisplay(HeadlessDisplay):
+    """Headless display saving the panel to a PNG file after every frame."""
+
+    def __init__(self, path='screen.png', width=TFT.ILI9341_TFTWIDTH, height=TFT.ILI9341_TFTHEIGHT):
+        self.path = path
+        super().__init__(width, height)
+
+    def _write_frame(self, image, regions):
+        super()._write_frame(image, regions)
+        # Replace the file in one step so a viewer never reads a partial PNG.
+        temporary = self.path + '.tmp'
+        self.snapshot().save(temporary, format='PNG')
+        os.replace(temporary, self.path)
+
+
+class FramebufferDisplay(HeadlessDisplay):
+    """Headless display copying the panel to a Linux framebuffer device
+    (16 bit RGB565 or 32 bit XRGB) after every frame.
+    """
+
+    def __init__(self, device='/dev/fb0', width=TFT.ILI9341_TFTWIDTH, height=TFT.ILI9341_TFTHEIGHT):
+        sysfs = '/sys/class/graphics/' + os.path.basename(device)
+        with open(sysfs + '/bits_per_pixel') as file:
+            self.bits_per_pixel = int(file.read())
+        with open(sysfs + '/stride') as file:
+            self.stride = int(file.read())
+        if self.bits_per_pixel not in (16, 32):
+            raise ValueError('Unsupported framebuffer depth: {0} bits'.format(self.bits_per_pixel))
+        self._fd = os.open(device, os.O_WRONLY)
+        super().__init__(width, height)
+
+    def close(self):
+        super().close()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _write_frame(self, image, regions):
+        super()._write_frame(image, regions)
+        if self._fd is None:
+            return
+        rgb = np.asarray(self.snapshot())
+        if self.bits_per_pixel == 16:
+            value = ((rgb[:,:,0].astype(np.uint16) >> 3) << 11) | ((rgb[:,:,1].astype(np.uint16) >> 2) << 5) | (rgb[:,:,2] >> 3)
+            pixels = value.astype('<u2').view(np.uint8).reshape(self.height, -1)
+        else:
+            pixels = np.empty((self.height, self.width, 4), dtype=np.uint8)
+            pixels[:,:,0] = rgb[:,:,2]
+            pixels[:,:,1] = rgb[:,:,1]
+            pixels[:,:,2] = rgb[:,:,0]
+            pixels[:,:,3] = 0xFF
+            pixels = pixels.reshape(self.height, -1)
+        for y in range(self.height):
+            os.pwrite(self._fd, pixels[y].tobytes(), y * self.stride)
+
+
+def create_display(backend='ili9341', width=TFT.ILI9341_TFTWIDTH, height=TFT.ILI9341_TFTHEIGHT, **options):
+    """Return the display driver for backend: 'ili9341' for the TFT on the SPI bus,
+    'memory', 'png' (option path) or 'framebuffer' (option device) for the headless
+    backends.  All of them share the ILI9341 API, close() releases the bus or device.
+    """
+    if backend == 'ili9341':
+        import SPI
+        BUS_FREQUENCY = 4000000
+        # Raspberry Pi configuration
+        PIN_DC     = 24
+        PIN_RST    = 25
+        SPI_PORT   = 0
+        SPI_DEVICE = 0
+        return TFT.ILI9341(dc     = PIN_DC,
+                           rst    = PIN_RST,
+                           spi    = SPI.SpiDev(SPI_PORT, SPI_DEVICE, max_speed_hz = BUS_FREQUENCY),
+                           width  = width,
+                           height = height)
+    elif backend == 'memory':
+        return HeadlessDisplay(width, height)
+    elif backend == 'png':
+        return PNGDisplay(options.get('path', 'screen.png'), width, height)
+    elif backend == 'framebuffer':
+        return FramebufferDisplay(options.get('device', '/dev/fb0'), width, height)
+    else:
+        raise ValueError('Unknown display backend: ' + str(backend))
@@ -0,0 +1,93 @@
+"""Per-frame render profiling. ScreenManager records the time each page takes to draw, the ILI9341
+driver the time spent converting the frame to RGB565, the time spent on the SPI bus and the bytes
+sent. The last samples of every page are kept for rolling percentiles, logged on exit."""
+import collections
+import logging
+import threading
+import time
+
+import numpy as np
+
+PHASES = ("draw_ms", "convert_ms", "spi_ms", "spi_bytes")
+PERCENTILES = (50, 95, 99)
+
+
+class FrameProfiler:
+
+    def __init__(self, window: int = 200) -> None:
+        self.window = window                  # samples kept per page and phase
+        self.page: str = None                 # page being drawn, None between pages
+        self.samples = dict()                 # page -> phase -> recent samples
+        self.frame_times = collections.deque(maxlen=window)   # when the last frames reached the panel
+        self._lock = threading.Lock()         # the driver records from its worker thread
+
+    def _record(self, page: str, phase: str, value: float) -> None:
+        page_samples = self.samples.get(page)
+        if page_samples is None:
+            page_samples = {name: collections.deque(maxlen=self.window) for name in PHASES}
+            self.samples[page] = page_samples
+        page_samples[phase].append(value)
+
+    def page_drawn(self, page: str, draw_ms: float) -> None:
+        with self._lock:
+            self._record(page, "draw_ms", draw_ms)
+
+    def frame_sent(self, page: str, convert_ms: float, spi_ms: float, spi_bytes: int) -> None:
+        with self._lock:
+            self._record(page, "convert_ms", convert_ms)
+            self._record(page, "spi_ms", spi_ms)
+            self._record(page, "spi_bytes", spi_bytes)
+            self.frame_times.append(time.perf_counter())
+
+    def wrap(self, page: str, function):
+        """Returns function timed as the drawing of page. Pages drawn from within another page count as part of it."""
+        def profiled(*args, **kwargs):
+            if self.page is not None:
+                return function(*args, **kwargs)
+            self.page = page
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.page_drawn(page, (time.perf_counter() - start) * 1000)
+                self.page = None
+        return profiled
+
+    def fps(self) -> float:
+        """Frames per second sent to the panel over the recent frames, 0 if fewer than two were sent"""
+        with self._lock:
+            if len(self.frame_times) < 2 or self.frame_times[-1] == self.frame_times[0]:
+                return 0.0
+            return (len(self.frame_times) - 1) / (self.frame_times[-1] - self.frame_times[0])
+
+    def percentiles(self, page: str, phase: str) -> tuple:
+        """PERCENTILES of the recent samples of a phase of page, None if there are none"""
+        with self._lock:
+            samples = list(self.samples.get(page, dict()).get(phase, tuple()))
+        if len(samples) == 0:
+            return None
+        return tuple(np.percentile(samples, PERCENTILES))
+
+    def summary(self) -> dict:
+        """page -> phase -> {"p50", "p95", "p99", "max", "samples"}"""
+        with self._lock:
+            pages = {page: {phase: list(values) for phase, values in phases.items()} for page, phases in self.samples.items()}
+
+        summary = dict()
+        for page, phases in pages.items():
+            summary[page] = dict()
+            for phase, samples in phases.items():
+                if len(samples) == 0:
+                    continue
+                stats = {"p" + str(q): round(float(value), 3) for q, value in zip(PERCENTILES, np.percentile(samples, PERCENTILES))}
+                stats["max"] = round(float(max(samples)), 3)
+                stats["samples"] = len(samples)
+                summary[page][phase] = stats
+        return summary
+
+    def log_summary(self) -> None:
+        for page, phases in self.summary().items():
+            logging.info("Render profile of %s: %s", page,
+                         ", ".join(phase + " " + "/".join(str(stats["p" + str(q)]) for q in PERCENTILES) + " max " + str(stats["max"])
+                                   for phase, stats in phases.items()))
+        logging.info("Render profile: %.1f fps over the last %d frames", self.fps(), len(self.frame_times))
@@ -1,12 +1,127 @@
+import asyncio
+import atexit
+import collections
+import functools
 import logging
+import math
+import threading
+import time
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
+import GPIO
 import ILI9341 as TFT
 import SPI
+from   displays import create_display
 from   XPT2046 import Touch
 
 from datatypes import DataContainer, WorkoutSegment, WorkoutParameters, WorkoutProgram, UserList, User
 from mqtt import MQTT_Exporter
+from profiler import FrameProfiler
+
+# Font sizes used by the pages, loaded when the ScreenManager starts
+UI_FONT_SIZES = (8, 9, 10, 11, 12, 14, 16, 18)
+# Font sizes of the live workout readouts, their glyph atlases are built when the ScreenManager starts
+READOUT_FONT_SIZES = (8, 11, 14, 16)
+
+_font_registry = dict()
+
+def get_font(face: str, size: int) -> ImageFont.FreeTypeFont:
+    """Returns the font for the (face, size) pair. Each pair is loaded from disk once
+    and shared by all pages for the lifetime of the process."""
+    key = (face, size)
+    font = _font_registry.get(key)
+    if font is None:
+        font = ImageFont.truetype(font=face, size=size)
+        _font_registry[key] = font
+    return font
+
+
+class GlyphAtlas:
+    """Pre-rasterised glyphs of one font. Text made only of these characters is composed by pasting
+    the cached glyph masks, which gives the same pixels as ImageDraw.text without the FreeType layout."""
+
+    CHARACTERS = "0123456789:.,-+%/ AM"
+
+    def __init__(self, font: ImageFont.FreeTypeFont, characters: str = CHARACTERS) -> None:
+        self.font = font
+        self.advances = {character: font.getlength(character) for character in characters}
+        
+        baseline_top = font.getbbox("0", anchor="ls")[1]
+        self.baseline_offsets = {v: font.getbbox("0", anchor="l"+v)[1] - baseline_top for v in "amsd"}
+        
+        self.tiles = dict()
+        for character in characters:
+            self.tile(character, 0, 0)
+
+    def tile(self, character: str, phase_x: float, phase_y: float) -> tuple:
+        """Mask and offset of the glyph drawn with its origin at a subpixel phase, in 1/64 px like FreeType"""
+
+        key = (character, round(phase_x * 64), round(phase_y * 64))
+        tile = self.tiles.get(key)
+        if tile is None:
+            PAD = 2
+            bbox = self.font.getbbox(character, anchor="ls")
+            image = Image.new("L", (bbox[2] - bbox[0] + 2*PAD, bbox[3] - bbox[1] + 2*PAD))
+            ImageDraw.Draw(image).text(xy=(PAD - bbox[0] + key[1]/64, PAD - bbox[1] + key[2]/64), text=character,
+                                       fill=255, font=self.font, anchor="ls")
+            ink = image.getbbox()
+            if ink is None:
+                tile = (None, (0, 0))
+            else:
+                tile = (image.crop(ink), (ink[0] - PAD + bbox[0], ink[1] - PAD + bbox[1]))
+            self.tiles[key] = tile
+        return tile
+
+    def supports(self, text: str, anchor: str) -> bool:
+        return (len(anchor) == 2 and anchor[0] in "lmr" and anchor[1] in "amsd" 
+                and all(character in self.advances for character in text))
+
+    def layout(self, xy: tuple, text: str, anchor: str = "la") -> tuple:
+        """Returns (bbox, mask) for text drawn at xy, the mask covering the bbox is ready to paste there.
+        The bbox covers the ink only, both are None for blank text."""
+
+        width = sum(self.advances[character] for character in text)
+        x = xy[0] - {"l": 0, "m": math.floor(width / 2 + 0.5), "r": math.floor(width + 0.5)}[anchor[0]]
+        y = xy[1] + self.baseline_offsets[anchor[1]]
+        
+        bbox = None
+        glyphs = list()
+        for character in text:
+            origin = (math.floor(x), math.floor(y))
+            mask, offset = self.tile(character, x - origin[0], y - origin[1])
+            x += self.advances[character]
+            if mask is None:
+                continue
+
+            position = (origin[0] + offset[0], origin[1] + offset[1])
+            glyphs.append((mask, position))
+            box = (position[0], position[1], position[0] + mask.width, position[1] + mask.height)
+            bbox = box if bbox is None else (min(bbox[0], box[0]), min(bbox[1], box[1]), max(bbox[2], box[2]), max(bbox[3], box[3]))
+        
+        if bbox is None:
+            return (None, None)
+        #### where glyphs overlap, PIL adds their coverage as a + b - a*b/255, rounded, pasting them one by one would not
+        mask = np.zeros((bbox[3] - bbox[1], bbox[2] - bbox[0]), dtype=np.uint16)
+        for glyph, position in glyphs:
+            x, y = position[0] - bbox[0], position[1] - bbox[1]
+            under = mask[y:y + glyph.height, x:x + glyph.width]
+            ink = np.asarray(glyph, dtype=np.uint16)
+            product = under * ink + 128
+            under += ink - ((product + (product >> 8)) >> 8)
+        return (bbox, Image.fromarray(mask.astype(np.uint8), "L"))
+
+
+_atlas_registry = dict()
+
+def get_glyph_atlas(font: ImageFont.FreeTypeFont) -> GlyphAtlas:
+    """Returns the glyph atlas of a font obtained from get_font(), built on first use"""
+    atlas = _atlas_registry.get(font)
+    if atlas is None:
+        atlas = GlyphAtlas(font)
+        _atlas_registry[font] = atlas
+    return atlas
+
 
 def formatTime(duration: int) -> str:
     duration = round(duration)
@@ -30,9 +145,395 @@ def formatTime(duration: int) -> str:
     return ret
 
 
-class TouchScreen:
+@functools.lru_cache(maxsize = 32)
+def render_segments_chart(chartWidth: int, chartHeight: int, segmentsChartData: tuple, totalDuration: int, maxPower: int, minPower: int,
+                          bgColour: tuple, segmentsColour: tuple) -> tuple:
+    """Rasterises the bars of a program's segments chart. Returns the image and the touch regions
+    of the bars. Results are kept in an LRU cache keyed by the program content, size and colours,
+    the image is shared and must not be drawn on."""
+
+    image = Image.new('RGB', (chartWidth, chartHeight), bgColour)
+    draw = ImageDraw.Draw(image)
+
+    noSegments = len(segmentsChartData)
+    segment_width_normalisation_factor  = totalDuration / (chartWidth - noSegments * 2)
+    segment_height_normalisation_factor = maxPower / chartHeight 
+
+    if segment_height_normalisation_factor == 0:
+        segment_height_normalisation_factor = 1
+
+    barHeightAdjustment: int = 0
+    minBarHeight = int(minPower / segment_height_normalisation_factor) +1
+    if minBarHeight > chartHeight / 5:
+        barHeightAdjustment = minBarHeight - chartHeight / 5
+    
+    maxBarHeight = int(maxPower / segment_height_normalisation_factor) +1 - barHeightAdjustment
+    barHeightScaler = chartHeight / maxBarHeight * 0.9
+
+    chartXPos = 0
+
+    touchActiveRegions = tuple()
+
+    for counter, segment in enumerate(segmentsChartData):
+
+        segment_wh = (int(segment[2] / segment_width_normalisation_factor) + 1,
+                     int((segment[1] / segment_height_normalisation_factor +1 - barHeightAdjustment) * barHeightScaler))
+
+        segment_xy = (chartXPos, chartHeight-segment_wh[1], chartXPos + segment_wh[0], chartHeight)
+        
+        draw.rectangle(xy=segment_xy, fill=segmentsColour)
+
+        touchActiveRegions += ((segment_xy, counter),)
+
+        chartXPos += segment_wh[0] + 2
+
+    return (image, touchActiveRegions)
+
+
+def downsample(x: np.ndarray, y: np.ndarray, buckets: int) -> tuple:
+    """Splits the samples into buckets of equal width along x and reduces every non-empty one
+    to the mean, minimum and maximum of its y values. Samples have to be sorted by x.
+    Returns (bucket indices, means, minimums, maximums) as NumPy arrays."""
+
+    span = x[-1] - x[0]
+    if span > 0:
+        index = np.minimum(((x - x[0]) * (buckets / span)).astype(np.intp), buckets - 1)
+    else:
+        index = np.zeros(len(x), dtype=np.intp)
+
+    columns, starts, counts = np.unique(index, return_index=True, return_counts=True)
+    means = np.add.reduceat(y, starts) / counts
+    return (columns, means, np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts))
+
+
+def outer_box(xy) -> tuple:
+    """Rounds a (possibly fractional) box outwards to whole pixels."""
+    return (math.floor(xy[0]), math.floor(xy[1]), math.ceil(xy[2]), math.ceil(xy[3]))
+
+
+class Widget:
+    """Element of a retained page. Setting an attribute through update() to a new
+    value invalidates the widget, the Compositor then redraws only invalidated widgets."""
+
+    def __init__(self, touch_label: str = None) -> None:
+        self.touch_label = touch_label
+        self.bounds: tuple = None    # box covered on the screen by the last draw
+        self.dirty = True
+        self.opaque = False          # True if draw() covers everything it measures, see Compositor.compose()
+
+    def invalidate(self) -> None:
+        self.dirty = True
+
+    def update(self, **attributes) -> None:
+        for name, value in attributes.items():
+            current = getattr(self, name)
+            if current is not value and current != value:
+                setattr(self, name, value)
+                self.dirty = True
+
+    def measure(self, draw: ImageDraw.ImageDraw) -> tuple:
+        """Box the next draw will cover, None if the widget draws nothing"""
+        raise NotImplementedError
 
-    def __init__(self) -> None:
+    def damaged(self, draw: ImageDraw.ImageDraw) -> tuple:
+        """Boxes the next draw of an opaque widget paints over, the measured box by default"""
+        return (self.measure(draw),)
+
+    def draw(self, draw: ImageDraw.ImageDraw, image: Image.Image) -> None:
+        raise NotImplementedError
+
+    def touch_region(self) -> tuple:
+        return None if self.touch_label is None or self.bounds is None else (self.bounds, self.touch_label)
+
+
+class Label(Widget):
+    """Single line of text, also used for the value readouts"""
+
+    def __init__(self, xy: tuple, text: str, font: ImageFont.FreeTypeFont, fill: tuple, anchor: str = "la", touch_label: str = None) -> None:
+        super().__init__(touch_label)
+        self.xy = xy
+        self.text = text
+        self.font = font
+        self.fill = fill
+        self.anchor = anchor
+
+    def measure(self, draw: ImageDraw.ImageDraw) -> tuple:
+        if not self.text:
+            return None
+        return draw.textbbox(xy=self.xy, text=self.text, font=self.font, anchor=self.anchor)
+
+    def draw(self, draw: ImageDraw.ImageDraw, image: Image.Image) -> None:
+        if self.text:
+            draw.text(xy=self.xy, text=self.text, fill=self.fill, font=self.font, anchor=self.anchor)
+
+
+class Readout(Label):
+    """Label for live numeric values, composed from the glyph atlas of its font whenever the
+    text allows it and drawn as regular text otherwise"""
+
+    def __init__(self, xy: tuple, text: str, font: ImageFont.FreeTypeFont, fill: tuple, anchor: str = "la", touch_label: str = None) -> None:
+        super().__init__(xy, text, font, fill, anchor, touch_label)
+        self._layout = (None, None)
+
+    def layout(self) -> tuple:
+        key = (self.xy, self.text, self.font, self.anchor)
+        if self._layout[0] != key:
+            atlas = get_glyph_atlas(self.font)
+            layout = atlas.layout(self.xy, self.text, self.anchor) if atlas.supports(self.text, self.anchor) else None
+            self._layout = (key, layout)
+        return self._layout[1]
+
+    def measure(self, draw: ImageDraw.ImageDraw) -> tuple:
+        layout = self.layout()
+        if layout is None:
+            return super().measure(draw)
+        return layout[0]
+
+    def draw(self, draw: ImageDraw.ImageDraw, image: Image.Image) -> None:
+        layout = self.layout()
+        if layout is None:
+            return super().draw(draw, image)
+        if layout[1] is not None:
+            image.paste(self.fill, layout[0][:2], layout[1])
+
+
+class Button(Widget):
+    """Rounded box with a centred label, touching it reports the label"""
+
+    def __init__(self, xy: tuple, text: str, font: ImageFont.FreeTypeFont, fill: tuple, text_fill: tuple,
+                 touch_label: str = None, radius: int = 3) -> None:
+        super().__init__(text if touch_label is None else touch_label)
+        self.xy = xy
+        self.text = text
+        self.font = font
+        self.fill = fill
+        self.text_fill = text_fill
+        self.radius = radius
+
+    def update(self, **attributes) -> None:
+        super().update(**attributes)
+        if "text" in attributes and "touch_label" not in attributes:
+            self.touch_label = self.text
+
+    def measure(self, draw: ImageDraw.ImageDraw) -> tuple:
+        return (self.xy[0], self.xy[1], self.xy[2]+1, self.xy[3]+1)    # PIL shapes include the far edge
+
+    def draw(self, draw: ImageDraw.ImageDraw, image: Image.Image) -> None:
+        draw.rounded_rectangle(xy=self.xy, radius=self.radius, fill=self.fill, outline=self.fill, width=2)
+        centre = ((self.xy[0]+self.xy[2])/2, (self.xy[1]+self.xy[3])/2)
+        draw.text(xy=centre, text=self.text, fill=self.text_fill, font=self.font, anchor="mm")
+
+    def touch_region(self) -> tuple:
+        return (self.xy, self.touch_label)
+
+
+class Chart(Widget):
+    """Pre-rendered image pasted at a fixed position: charts, icons, sprites"""
+
+    def __init__(self, xy: tuple, image: Image.Image = None, touch_label: str = None) -> None:
+        super().__init__(touch_label)
+        self.xy = xy
+        self.image = image
+
+    def measure(self, draw: ImageDraw.ImageDraw) -> tuple:
+        if self.image is None:
+            return None
+        return (self.xy[0], self.xy[1], self.xy[0] + self.image.width, self.xy[1] + self.image.height)
+
+    def draw(self, draw: ImageDraw.ImageDraw, image: Image.Image) -> None:
+        if self.image is not None:
+            image.paste(self.image, self.xy)
+
+
+class LiveChart(Widget):
+    """Strip chart of a live value, one column per sample. The chart image is kept between frames
+    and swept like a monitor trace: a sample is drawn into the column at the cursor, which then
+    advances and wraps around, so only the columns drawn since the last frame are composed and sent
+    to the display. The chart is redrawn from the kept samples only when a sample exceeds the range."""
+
+    GAP = 4     # blank columns ahead of the cursor, marking where the trace is written
+
+    def __init__(self, xy: tuple, size: tuple, line: tuple, fill: tuple, background: tuple, value_range: tuple) -> None:
+        super().__init__()
+        self.opaque = True
+        self.xy = xy
+        self.line = line
+        self.fill = fill
+        self.background = background
+        self.value_range = value_range
+        self.low, self.high = value_range
+        self.image = Image.new("RGB", size, background)
+        self._draw = ImageDraw.Draw(self.image)
+        self.samples = collections.deque(maxlen = size[0] - self.GAP)
+        self.cursor = 0
+        self.time = None
+        self.damage: list = None      # spans of columns, first and last + 1, drawn since the last compose
+
+    def to_y(self, value: float) -> int:
+        height = self.image.height - 1
+        value = min(max(value, self.low), self.high)
+        return height - round((value - self.low) * height / (self.high - self.low))
+
+    def clear(self) -> None:
+        self.low, self.high = self.value_range
+        self.samples.clear()
+        self.cursor = 0
+        self.time = None
+        self._draw.rectangle((0, 0, self.image.width, self.image.height), fill = self.background)
+        self.damage = [(0, self.image.width)]
+        self.dirty = True
+
+    def sample(self, time: float, value: float) -> None:
+        """Appends value for every whole second since the last sample, time going backwards starts a new trace"""
+        now = int(time)
+        if self.time is not None and now < self.time:
+            self.clear()
+        steps = 1 if self.time is None else min(now - self.time, self.samples.maxlen)
+        for _ in range(steps):
+            self.append(value)
+        self.time = now
+
+    def append(self, value: float) -> None:
+        previous = self.samples[-1] if self.samples else None
+        self.samples.append(value)
+        if value > self.high:
+            self.high = math.ceil(value * 1.25 / 10) * 10
+            self.redraw()
+        else:
+            self.draw_column(self.cursor, previous, value)
+            self.clear_gap()
+            width = self.image.width
+            end = self.cursor + self.GAP + 1
+            self.mark(self.cursor, min(end, width))
+            if end > width:     # the gap wraps around to the left edge
+                self.mark(0, end - width)
+        self.cursor = (self.cursor + 1) % self.image.width
+        self.dirty = True
+
+    def mark(self, first: int, last: int) -> None:
+        """Adds the columns first to last - 1 to the damage, merged with the spans they touch"""
+        spans = list()
+        for span in self.damage or ():
+            if span[1] < first or span[0] > last:
+                spans.append(span)
+            else:
+                first, last = min(first, span[0]), max(last, span[1])
+        spans.append((first, last))
+        self.damage = sorted(spans)
+
+    def draw_column(self, x: int, previous: float, value: float) -> None:
+        bottom = self.image.height - 1
+        y = self.to_y(value)
+        y_previous = y if previous is None else self.to_y(previous)
+        self._draw.line((x, 0, x, bottom), fill = self.background)
+        self._draw.line((x, y, x, bottom), fill = self.fill)
+        self._draw.line((x, min(y, y_previous), x, max(y, y_previous)), fill = self.line)
+
+    def clear_gap(self) -> None:
+        for i in range(1, self.GAP + 1):
+            x = (self.cursor + i) % self.image.width
+            self._draw.line((x, 0, x, self.image.height - 1), fill = self.background)
+
+    def redraw(self) -> None:
+        self._draw.rectangle((0, 0, self.image.width, self.image.height), fill = self.background)
+        previous = None
+        for i, value in enumerate(self.samples):
+            self.draw_column((self.cursor - len(self.samples) + 1 + i) % self.image.width, previous, value)
+            previous = value
+        self.clear_gap()
+        self.damage = [(0, self.image.width)]
+
+    def columns(self) -> list:
+        if self.bounds is None:
+            return [(0, self.image.width)]
+        return self.damage or []
+
+    def measure(self, draw: ImageDraw.ImageDraw) -> tuple:
+        columns = self.columns()
+        if not columns:
+            return None
+        return (self.xy[0] + columns[0][0], self.xy[1], self.xy[0] + columns[-1][1], self.xy[1] + self.image.height)
+
+    def damaged(self, draw: ImageDraw.ImageDraw) -> tuple:
+        return tuple((self.xy[0] + first, self.xy[1], self.xy[0] + last, self.xy[1] + self.image.height) for first, last in self.columns())
+
+    def draw(self, draw: ImageDraw.ImageDraw, image: Image.Image) -> None:
+        for first, last in self.columns():
+            image.paste(self.image.crop((first, 0, last, self.image.height)), (self.xy[0] + first, self.xy[1]))
+        self.damage = None
+
+
+class Compositor:
+    """Draws a retained page: a static background with widgets on top. Widgets must not overlap,
+    a redrawn widget restores the background under both its old and its new bounds, an opaque
+    widget only reports the boxes it paints over itself, see Widget.damaged()."""
+
+    def __init__(self, background: Image.Image, touch_regions: tuple = tuple()) -> None:
+        self.background = background
+        self.static_touch_regions = touch_regions
+        self.widgets = dict()
+
+    def add(self, name: str, widget: Widget) -> Widget:
+        self.widgets[name] = widget
+        return widget
+
+    def __getitem__(self, name: str) -> Widget:
+        return self.widgets[name]
+
+    def touch_regions(self) -> tuple:
+        regions = tuple(widget.touch_region() for widget in self.widgets.values())
+        return self.static_touch_regions + tuple(region for region in regions if region is not None)
+
+    def compose(self, image: Image.Image, full: bool = False) -> list:
+        """Draws the invalidated widgets into image and returns the regions that changed.
+        With full set the whole page is drawn, background included."""
+
+        if full:
+            image.paste(self.background)
+            for widget in self.widgets.values():
+                widget.bounds = None
+                widget.dirty = True
+
+        draw = ImageDraw.Draw(image)
+        regions = list()
+        for widget in self.widgets.values():
+            if not widget.dirty:
+                continue
+
+            new_bounds = widget.measure(draw)
+            for box in (widget.damaged(draw) if widget.opaque else (widget.bounds, new_bounds)):
+                if box is not None:
+                    x0, y0, x1, y1 = outer_box(box)
+                    box = (max(x0, 0), max(y0, 0), min(x1, image.width), min(y1, image.height))
+                    if box[0] >= box[2] or box[1] >= box[3]:
+                        continue
+                    if not widget.opaque:
+                        image.paste(self.background.crop(box), box[:2])
+                    regions.append(box)
+
+            widget.draw(draw, image)
+            widget.bounds = new_bounds
+            widget.dirty = False
+
+        return regions
+
+
+TouchEvent = collections.namedtuple("TouchEvent", ["type", "location", "timestamp", "raw"])   # type is "Press" or "Release"
+
+
+class TouchScreen:
+    """Touch panel on the XPT2046. A background thread samples the controller and publishes debounced
+    press and release events, which the event loop reads with next_event()."""
+
+    SAMPLE_INTERVAL = 0.02      # seconds between samples while pressed, or while polling without PENIRQ
+    RELEASE_SAMPLES = 2         # samples without touch that end a press
+    MAX_EVENT_AGE   = 1.0       # seconds, older events are dropped by next_event()
+    QUEUE_SIZE      = 16
+    CALIBRATION_MAX_ERROR = 8   # pixels, see calculateCalibrationConstants()
+
+    def __init__(self, irq_pin: int = None, gpio: GPIO.BaseGPIO = None) -> None:
+        """irq_pin is the GPIO wired to the PENIRQ output of the XPT2046, which goes low while the panel is pressed.
+        With it the controller is only sampled over SPI when pressed, otherwise it is polled."""
         BUS_FREQUENCY = 4000000
         # Raspberry Pi configuration
         SPI_PORT   = 0
@@ -44,80 +545,209 @@ class TouchScreen:
         
         self.setCalibration(0.176264, -14.6438, 0.133167, -12.7923)   # default calibration, to be overwriten with values loaded from config
 
-    
+        self.sampler: threading.Thread = None
+        self.events: asyncio.Queue = None       # bound to the event loop reading them, see next_event()
+        self.loop: asyncio.AbstractEventLoop = None
+
+        self.irq_pin = irq_pin
+        self.irq = threading.Event()            # set on every falling edge of PENIRQ
+        if irq_pin is not None:
+            self.gpio = GPIO.get_platform_gpio() if gpio is None else gpio
+            self.gpio.setup(irq_pin, GPIO.IN, GPIO.PUD_UP)
+            self.gpio.add_event_detect(irq_pin, GPIO.FALLING, callback = self.on_press)
+
+    def on_press(self, pin: int) -> None:
+        #### Called by the GPIO library from its own thread
+        self.irq.set()
+
+    def is_pressed(self) -> bool:
+        """Level of PENIRQ, the Z1 reading of the controller if no PENIRQ line is connected"""
+        if self.irq_pin is None:
+            return self.touchscreen.is_pressed()
+        return self.gpio.is_low(self.irq_pin)
+
+    def start_sampler(self) -> None:
+        if self.sampler is None:
+            self.sampler = threading.Thread(target = self.run_sampler, name = "TouchSampler", daemon = True)
+            self.sampler.start()
+
+    def run_sampler(self) -> None:
+        location = None     # of the ongoing press
+        misses = 0
+        while True:
+            if location is None and self.irq_pin is not None:
+                #### sleep until the panel is pressed
+                self.irq.clear()
+                if not self.is_pressed():
+                    self.irq.wait()
+
+            raw = self.sample_raw()
+            if raw is not None:
+                misses = 0
+                if location is None:
+                    self.publish(TouchEvent("Press", self.scaleCoordinates(raw), time.monotonic(), raw))
+                location, location_raw = self.scaleCoordinates(raw), raw
+            elif location is not None:
+                misses += 1
+                if misses >= self.RELEASE_SAMPLES:
+                    self.publish(TouchEvent("Release", location, time.monotonic(), location_raw))
+                    location = None
+            time.sleep(self.SAMPLE_INTERVAL)
+
+    def publish(self, event: TouchEvent) -> None:
+        loop, events = self.loop, self.events
+        if loop is None or loop.is_closed():
+            return      # nobody is listening
+
+        def put() -> None:
+            if events.full():
+                events.get_nowait()     # the oldest event gives way
+            events.put_nowait(event)
+        loop.call_soon_threadsafe(put)
+
+    async def next_event(self, timeout: float = None) -> TouchEvent:
+        """Waits for the next touch event, returns None if the timeout (in seconds) expired first.
+        Events older than MAX_EVENT_AGE are dropped."""
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:       #### every asyncio.run() has its own loop
+            self.events = asyncio.Queue(self.QUEUE_SIZE)
+            self.loop = loop
+        self.start_sampler()
+
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            try:
+                remaining = None if deadline is None else max(0, deadline - loop.time())
+                event: TouchEvent = await asyncio.wait_for(self.events.get(), remaining)
+            except asyncio.TimeoutError:
+                return None
+            if time.monotonic() - event.timestamp <= self.MAX_EVENT_AGE:
+                return event
+
     def setCalibration(self, x_multiplier: float, x_offset: float, y_multiplier: float, y_offset: float) -> None:
-        
-        self.x_multiplier = x_multiplier
-        self.x_offset = x_offset
+        """Per axis calibration of the older two point procedure, converted to the equivalent affine transform"""
+        self.setAffineCalibration((0.0, -x_multiplier, self.WIDTH - x_offset,
+                                   -y_multiplier, 0.0, self.HEIGHT - y_offset))
 
-        self.y_multiplier = y_multiplier
-        self.y_offset = y_offset
-    
+    def setAffineCalibration(self, affine: tuple) -> None:
+        """affine holds the 6 coefficients (a, b, c, d, e, f) mapping a raw reading (X, Y) to the screen as
+        x = a*X + b*Y + c and y = d*X + e*Y + f, which corrects scale, offset, rotation and skew"""
+        self.affine = tuple(float(coefficient) for coefficient in affine)
 
     def scaleCoordinates(self, point: tuple) -> tuple:
         """Scales raw X,Y values to match the LCD screen pixel dimensions."""
         a, b = point
-        x = self.WIDTH  - int(self.x_multiplier * b + self.x_offset)
-        y = self.HEIGHT - int(self.y_multiplier * a + self.y_offset)
-        
-        return (x, y)
-    
-    
-    def calculateCalibrationConstants(self, requestedPoints: tuple, measuredPoints: tuple) -> tuple:
-
-        measuredP1,  measuredP2  = measuredPoints
-        requestedP1, requestedP2 = requestedPoints
+        c_xa, c_xb, c_x, c_ya, c_yb, c_y = self.affine
+        return (int(c_xa * a + c_xb * b + c_x), int(c_ya * a + c_yb * b + c_y))
 
-        requestedPoint_1x, requestedPoint_1y = requestedP1    # unpack into x, y pair
-        requestedPoint_2x, requestedPoint_2y = requestedP2
-        
-        measuredPoint_1x, measuredPoint_1y = measuredP1     # unpack into x, y pair
-        measuredPoint_2x, measuredPoint_2y = measuredP2
+    def calculateCalibrationConstants(self, requestedPoints: tuple, measuredPoints: tuple) -> tuple:
+        """Fits the affine calibration to raw readings measuredPoints taken at the screen points requestedPoints,
+        at least 3 pairs, by least squares. With more than 4 pairs a touch which misses the fit of the other ones
+        by more than CALIBRATION_MAX_ERROR pixels is left out, so a single bad touch cannot spoil the calibration.
+        Applies and returns the 6 coefficients, see setAffineCalibration()."""
 
-        measuredPoint_1x_raw = ((self.WIDTH - measuredPoint_1x) - self.x_offset) / self.x_multiplier
-        measuredPoint_2x_raw = ((self.WIDTH - measuredPoint_2x) - self.x_offset) / self.x_multiplier
+        requested = np.asarray(requestedPoints, dtype=float)
+        measured = np.column_stack((np.asarray(measuredPoints, dtype=float), np.ones(len(measuredPoints))))
 
-        measuredPoint_1y_raw = ((self.HEIGHT - measuredPoint_1y) - self.y_offset) / self.y_multiplier
-        measuredPoint_2y_raw = ((self.HEIGHT - measuredPoint_2y) - self.y_offset) / self.y_multiplier
+        def fit(rows: np.ndarray) -> np.ndarray:
+            return np.linalg.lstsq(measured[rows], requested[rows], rcond=None)[0]     # 3x2, a column per screen axis
 
-        self.x_multiplier = (requestedPoint_2x - requestedPoint_1x) / abs((measuredPoint_2x_raw - measuredPoint_1x_raw))
-        self.x_offset = self.WIDTH - self.x_multiplier * measuredPoint_1x_raw - requestedPoint_1x
+        def errors(rows: np.ndarray, solution: np.ndarray) -> np.ndarray:
+            return np.hypot(*(measured[rows] @ solution - requested[rows]).T)
 
-        self.y_multiplier = (requestedPoint_2y - requestedPoint_1y) / abs((measuredPoint_2y_raw - measuredPoint_1y_raw))
-        self.y_offset = self.HEIGHT - self.y_multiplier * measuredPoint_1y_raw - requestedPoint_1y
+        rows = np.arange(len(requested))
+        if len(rows) > 4:
+            #### the touch whose removal fits the others best is the suspect, it is dropped if it misses that fit
+            fits = [fit(rows[rows != row]) for row in rows]
+            suspect = int(np.argmin([np.sum(errors(rows[rows != row], solution) ** 2) for row, solution in zip(rows, fits)]))
+            if errors(rows[suspect:suspect+1], fits[suspect])[0] > self.CALIBRATION_MAX_ERROR:
+                rows = rows[rows != suspect]
+        solution = fit(rows)
 
-        return (self.x_multiplier, self.x_offset, self.y_multiplier, self.y_offset)
+        self.setAffineCalibration(tuple(solution[:, 0]) + tuple(solution[:, 1]))
+        return self.affine
 
+    def sample_raw(self) -> tuple:
+        """Filtered raw (X, Y) reading of the panel, None if it is not pressed"""
+        if not self.is_pressed():       #### nothing to sample, skips the SPI transfers
+            return None
 
-    def checkTouch(self) -> tuple:
         rawTouch = self.touchscreen.get_touch()
 
         if rawTouch is None:
-            return (False, (0,0))
+            return None
         
         elif rawTouch[1] > 2000:
-            return (False, (0,0))
+            return None
             
         else:
-            scaled = self.scaleCoordinates(rawTouch)
-            return (True, scaled)
+            return rawTouch
+
+    def sample(self) -> tuple:
+        """Filtered reading of the panel, the location on the screen or None if it is not pressed"""
+        raw = self.sample_raw()
+        return None if raw is None else self.scaleCoordinates(raw)
+
+    def checkTouch(self) -> tuple:
+        location = self.sample()
+        return (False, (0,0)) if location is None else (True, location)
+
+class TouchIndex:
+    """Grid index of the touch regions of a page, ((x1, y1, x2, y2), value) pairs with inclusive boxes.
+    A region may carry a layer as a third item, 0 if it has none. Where regions overlap, the one in the
+    highest layer is hit, and within a layer the first one in the tuple, on shared edges for example."""
+
+    CELL_SIZE = 16
+
+    def __init__(self, regions: tuple, width: int = 320, height: int = 240) -> None:
+        self.regions = regions
+        self.columns = -(-width // self.CELL_SIZE)
+        self.rows = -(-height // self.CELL_SIZE)
+        self.cells = [list() for _ in range(self.columns * self.rows)]   # region numbers, topmost first
+
+        #### regions are added from the top down, so every cell lists them in the order they are tried
+        layers = [region[2] if len(region) > 2 else 0 for region in regions]
+        for number in sorted(range(len(regions)), key = lambda number: -layers[number]):
+            x1, y1, x2, y2 = regions[number][0]
+            for row in range(max(0, math.floor(y1) // self.CELL_SIZE), min(self.rows - 1, math.floor(y2) // self.CELL_SIZE) + 1):
+                for column in range(max(0, math.floor(x1) // self.CELL_SIZE), min(self.columns - 1, math.floor(x2) // self.CELL_SIZE) + 1):
+                    self.cells[row * self.columns + column].append(number)
+
+    def hit(self, point: tuple):
+        """Value of the topmost region containing point, None if there is none"""
+        x, y = point
+        column, row = math.floor(x) // self.CELL_SIZE, math.floor(y) // self.CELL_SIZE
+        if not (0 <= column < self.columns and 0 <= row < self.rows):
+            return None
+        for number in self.cells[row * self.columns + column]:
+            x1, y1, x2, y2 = self.regions[number][0]
+            if x1 <= x <= x2 and y1 <= y <= y2:
+                return self.regions[number][1]
+        return None
+
 
 class ScreenManager:
     
     dataContainer = DataContainer()
+
+    #### methods drawing and sending a whole page, timed by the profiler
+    PROFILED_PAGES = ("drawPageSettings", "drawStringEditor", "drawPageHistory", "draw_page_historical_record_details",
+                      "drawProgramEditor", "draw_page_ble_discovery", "draw_page_wifi", "drawMessageBox",
+                      "drawProgramSelector", "drawPageCalibration", "drawPageWorkout", "draw_page_user_editor",
+                      "draw_page_settings_mqtt", "drawPageUserSelect", "drawPageMainMenu")
     
-    def __init__(self) -> None:
+    def __init__(self, backend: str = "ili9341", profiler: FrameProfiler = None, overlay: bool = False, **backend_options) -> None:
+        """backend selects the display driver, see displays.create_display(). With a profiler every page and
+        frame is timed, overlay then shows the frame rate and the frame time of the page in the top left corner."""
         
         self.WIDTH  = 320
         self.HEIGHT = 240
-        BUS_FREQUENCY = 4000000
-        # Raspberry Pi configuration
-        PIN_DC     = 24
-        PIN_RST    = 25
-        SPI_PORT   = 0
-        SPI_DEVICE = 0
 
         self.font_name = "Roboto-Regular.ttf"
+        for size in UI_FONT_SIZES:
+            get_font(self.font_name, size)
+        for size in READOUT_FONT_SIZES:
+            get_glyph_atlas(get_font(self.font_name, size))
 
         self.MARGIN_LARGE: int  = 12
         self.MARGIN_SMALL: int  = 6
@@ -133,57 +763,185 @@ class ScreenManager:
         self.COLOUR_TT:         tuple = (38,  188, 196)
         self.COLOUR_CLIMBER:    tuple = (32,  140,  20)
 
-        self.display = TFT.ILI9341(dc     = PIN_DC, 
-                                   rst    = PIN_RST, 
-                                   spi    = SPI.SpiDev(SPI_PORT, SPI_DEVICE, max_speed_hz = BUS_FREQUENCY), 
-                                   width  = self.WIDTH, 
-                                   height = self.HEIGHT)
+        self.ICON_HEIGHT_HEART:   int = 23
+        self.ICON_HEIGHT_TRAINER: int = 27
+        self.ICON_HEIGHT_BATTERY: int = 26
+        self.SOC_BUCKET:          int = 5     # battery icons are drawn in steps of 5 %
+
+        self.display: TFT.ILI9341 = create_display(backend, self.WIDTH, self.HEIGHT, **backend_options)
         self.display.begin()
         self.display.clear(self.COLOUR_BG)    # Clear to background
+        self.display.start_worker()           # SPI transfers run in the background, off the event loop
+        atexit.register(self.close)
+
+        self.active_page: str = None          # page shown by the last refresh, None if unknown
+        self.static_layers = dict()           # pre-rendered page backgrounds, see paste_static_layer()
+        self.compositors = dict()             # retained pages, see show_page()
+        self.sprites = dict()                 # pre-rendered icons, see get_sprite()
+        self.preload_sprites()
+
+        self.profiler = profiler
+        self.overlay = overlay and profiler is not None
+        self.overlay_frame_ms = dict()        # page -> [frame time shown, frames drawn, frames at the next update]
+        if profiler is not None:
+            self.display.profiler = profiler
+            for name in self.PROFILED_PAGES:
+                setattr(self, name, profiler.wrap(name, getattr(self, name)))
+            atexit.register(profiler.log_summary)
 
         #self.im = Image.new('RGB', (self.WIDTH, self.HEIGHT), self.COLOUR_BG)
 
+    def close(self) -> None:
+        """Sends the last frame and releases the display, called on exit"""
+        self.display.close()
+
     def assignDataContainer (self, container: DataContainer) -> None:
         self.dataContainer:DataContainer = container
     
+    def refresh(self, page: str = None, regions: list = None) -> None:
+        """Send the display buffer to the screen. A page redrawn on top of itself
+        can pass the regions that changed since its previous frame, only those are
+        sent over SPI. Any other refresh writes the full frame."""
+
+        if page is not None and page == self.active_page and regions is not None:
+            for region in regions:
+                self.display.mark_dirty(region)
+            if self.overlay:
+                self.display.mark_dirty(self.profiler_overlay())
+        elif self.overlay:
+            self.profiler_overlay()
+        
+        self.active_page = page
+        self.display.display()
+
+    def profiler_overlay(self) -> tuple:
+        """Draws the frame rate and the median frame time of the page being drawn over the display buffer,
+        returns the box covered. The median is updated once per profiler window, more often while it fills."""
+
+        cached = self.overlay_frame_ms.get(self.profiler.page)
+        if cached is None:
+            cached = self.overlay_frame_ms[self.profiler.page] = [0, 0, 0]
+        if cached[1] >= cached[2]:
+            frame_ms = 0
+            for phase in ("draw_ms", "convert_ms", "spi_ms"):
+                percentiles = self.profiler.percentiles(self.profiler.page, phase)
+                frame_ms += 0 if percentiles is None else percentiles[0]
+            cached[0] = frame_ms
+            cached[2] = cached[1] + min(max(cached[1], 1), self.profiler.window)
+        cached[1] += 1
+        frame_ms = cached[0]
+        box = (0, 0, 80, 11)
+        draw = self.display.draw()
+        draw.rectangle(xy = (box[0], box[1], box[2]-1, box[3]-1), fill = self.COLOUR_BG)
+        draw.text(xy = (2, 1), text = "{0:.1f} fps {1:.0f} ms".format(self.profiler.fps(), frame_ms),
+                  fill = self.COLOUR_OUTLINE, font = get_font(self.font_name, 8))
+        return box
+
+    def static_layer(self, key: tuple, draw_static) -> tuple:
+        """Returns the (image, touch regions) pair holding the static background of a page (boxes, labels,
+        buttons). The layer is rendered once by draw_static(draw) and reused afterwards, so the key has
+        to cover every parameter the static content depends on. Layers are kept in RGB, the mode of the
+        display buffer, so pasting and cropping them needs no conversion."""
+
+        layer = self.static_layers.get(key)
+        if layer is None:
+            image = Image.new("RGB", (self.WIDTH, self.HEIGHT), self.COLOUR_BG)
+            touchActiveRegions = draw_static(ImageDraw.Draw(image))
+            layer = (image, touchActiveRegions)
+            self.static_layers[key] = layer
+        return layer
+
+    def paste_static_layer(self, key: tuple, draw_static) -> tuple:
+        """Pastes the static layer of a page into the display buffer and returns its touch regions."""
+
+        image, touchActiveRegions = self.static_layer(key, draw_static)
+        self.display.buffer.paste(image)
+        return touchActiveRegions
+
+    def get_sprite(self, icon: str, height: int, colours: tuple, state_of_charge: int = None) -> Image.Image:
+        """Returns the icon ("heart", "trainer" or "battery") rendered at height with colours, which are
+        (fill, outline, background) for the device icons and (background,) for the battery. Images are
+        cached, the battery per SOC_BUCKET step of state_of_charge. Sprites are shared, do not draw on them."""
+
+        if state_of_charge is not None:
+            state_of_charge = int(max(0, min(state_of_charge, 100)) // self.SOC_BUCKET * self.SOC_BUCKET)
+
+        key = (icon, height, colours, state_of_charge)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            if icon == "heart":
+                sprite = self.drawHeart(height, *colours)
+            elif icon == "trainer":
+                sprite = self.drawTrainer(height, *colours)
+            elif icon == "battery":
+                sprite = self.draw_battery(height, state_of_charge, *colours)
+            else:
+                raise ValueError("Unknown icon: " + str(icon))
+            self.sprites[key] = sprite
+        return sprite
+
+    def preload_sprites(self) -> None:
+        """Renders every icon variant the pages use, so blinking icons never hit the drawing code"""
+
+        for colour in (self.COLOUR_HEART, self.COLOUR_BG_LIGHT):
+            self.get_sprite("heart", self.ICON_HEIGHT_HEART, (colour, self.COLOUR_OUTLINE, self.COLOUR_BG))
+        for colour in (self.COLOUR_TT, self.COLOUR_BG_LIGHT):
+            self.get_sprite("trainer", self.ICON_HEIGHT_TRAINER, (colour, self.COLOUR_OUTLINE, self.COLOUR_BG))
+        for state_of_charge in range(0, 101, self.SOC_BUCKET):
+            self.get_sprite("battery", self.ICON_HEIGHT_BATTERY, (self.COLOUR_BG,), state_of_charge)
+            if state_of_charge < 25:
+                self.get_sprite("battery", self.ICON_HEIGHT_BATTERY, (self.COLOUR_BG_LIGHT,), state_of_charge)
+
+    def show_page(self, key: tuple, compositor: Compositor) -> tuple:
+        """Redraws the invalidated widgets of a retained page and sends only their regions,
+        or the whole page if another one was on the screen. Returns the touch regions."""
+
+        full = key != self.active_page
+        regions = compositor.compose(self.display.buffer, full)
+        if full or len(regions) > 0:    # nothing invalidated, nothing to send
+            self.refresh(key, regions)
+        return compositor.touch_regions()
+
 
     def drawPageSettings(self, screen_names: tuple, touch_labels: tuple, back_state: str) -> tuple:
-        draw = self.display.draw() # Get a PIL Draw object
-        self.display.clear(self.COLOUR_BG) 
         
-        touchActiveRegions = tuple()
+        def draw_static(draw: ImageDraw.ImageDraw) -> tuple:
+            touchActiveRegions = tuple()
 
-        font = ImageFont.truetype(font=self.font_name, size=10)
-        button_mainMenu_xy = (self.MARGIN_SMALL, self.MARGIN_SMALL,
-                              self.MARGIN_SMALL + int(font.getlength("Back"))+4, self.MARGIN_SMALL+16)
-        button_centre = ((button_mainMenu_xy[2]+button_mainMenu_xy[0])/2, (button_mainMenu_xy[3]+button_mainMenu_xy[1])/2)
-        draw.rounded_rectangle(xy=button_mainMenu_xy, radius=3, fill=self.COLOUR_BG_LIGHT, outline=self.COLOUR_OUTLINE)
-        draw.text(xy=button_centre, text="Back", anchor="mm", font=font, fill=self.COLOUR_TEXT_LIGHT, align="center")
-        touchActiveRegions += ((button_mainMenu_xy, back_state),)
+            font = get_font(self.font_name, 10)
+            button_mainMenu_xy = (self.MARGIN_SMALL, self.MARGIN_SMALL,
+                                  self.MARGIN_SMALL + int(font.getlength("Back"))+4, self.MARGIN_SMALL+16)
+            button_centre = ((button_mainMenu_xy[2]+button_mainMenu_xy[0])/2, (button_mainMenu_xy[3]+button_mainMenu_xy[1])/2)
+            draw.rounded_rectangle(xy=button_mainMenu_xy, radius=3, fill=self.COLOUR_BG_LIGHT, outline=self.COLOUR_OUTLINE)
+            draw.text(xy=button_centre, text="Back", anchor="mm", font=font, fill=self.COLOUR_TEXT_LIGHT, align="center")
+            touchActiveRegions += ((button_mainMenu_xy, back_state),)
 
-        font = ImageFont.truetype(font=self.font_name, size=12)
+            font = get_font(self.font_name, 12)
 
-        button_height = 50
-        button_width  = int((self.WIDTH - 3 * self.MARGIN_LARGE)/2)
-        b_gap    = 10
-        x_0      = self.MARGIN_LARGE
-        y_0      = 60
-        buttons_xy = list()
-        for i in range(6):
-            x_start = x_0 + int(i/3) * (button_width + x_0)
-            y_start = y_0 + (button_height + b_gap) * (i % 3)
-            buttons_xy.append((x_start, y_start, x_start + button_width, y_start+button_height))
+            button_height = 50
+            button_width  = int((self.WIDTH - 3 * self.MARGIN_LARGE)/2)
+            b_gap    = 10
+            x_0      = self.MARGIN_LARGE
+            y_0      = 60
+            buttons_xy = list()
+            for i in range(6):
+                x_start = x_0 + int(i/3) * (button_width + x_0)
+                y_start = y_0 + (button_height + b_gap) * (i % 3)
+                buttons_xy.append((x_start, y_start, x_start + button_width, y_start+button_height))
 
-        touch_labels = screen_names if touch_labels is None else touch_labels
+            labels = screen_names if touch_labels is None else touch_labels
 
-        for button_xy, screenLabel, touchLabel in zip(buttons_xy, screen_names, touch_labels):
-        
-            button_centre = ((button_xy[2]+button_xy[0])/2, (button_xy[3]+button_xy[1])/2)
-            draw.rounded_rectangle(xy=button_xy, radius=3, fill=self.COLOUR_BG_LIGHT, outline=self.COLOUR_OUTLINE)
-            draw.text(xy=button_centre, text=screenLabel, anchor="mm", font=font, fill=self.COLOUR_TEXT_LIGHT, align="center")
-            touchActiveRegions += ((button_xy, touchLabel),)
+            for button_xy, screenLabel, touchLabel in zip(buttons_xy, screen_names, labels):
 
-        self.display.display()
+                button_centre = ((button_xy[2]+button_xy[0])/2, (button_xy[3]+button_xy[1])/2)
+                draw.rounded_rectangle(xy=button_xy, radius=3, fill=self.COLOUR_BG_LIGHT, outline=self.COLOUR_OUTLINE)
+                draw.text(xy=button_centre, text=screenLabel, anchor="mm", font=font, fill=self.COLOUR_TEXT_LIGHT, align="center")
+                touchActiveRegions += ((button_xy, touchLabel),)
+
+            return touchActiveRegions
+
+        touchActiveRegions = self.paste_static_layer(("Settings", screen_names, touch_labels, back_state), draw_static)
+        self.refresh()
         return touchActiveRegions
 
     def drawStringEditor(self, string: str, caretPos:int = None, selection: tuple = None, keyboardUpperCase: bool = None, keyboardSpecials:str=False):
@@ -192,7 +950,7 @@ class ScreenManager:
         
         #image = Image.new(mode="RGB", size= (self.WIDTH, self.HEIGHT), color=self.COLOUR_BG)
         #draw = ImageDraw.Draw(image)
-        font = ImageFont.truetype(font=self.font_name, size=12)
+        font = get_font(self.font_name, 12)
         
         
         touchActiveRegions = tuple()
@@ -232,18 +990,21 @@ class ScreenManager:
         #### edit box
         box_corner_radius = 12
         draw.rounded_rectangle(xy=editor_box_xy, radius=box_corner_radius, fill=self.COLOUR_BG_LIGHT)
-        font = ImageFont.truetype(font=self.font_name, size=12)
+        font = get_font(self.font_name, 12)
         draw.text(xy=(editor_box_xy[0]+self.MARGIN_SMALL, editor_box_xy[1]+box_corner_radius+self.MARGIN_SMALL), text=string, font=font, anchor="lt", fill=self.COLOUR_OUTLINE)
 
 
         self.display.buffer.paste(im = keyboard, box=(int(keyboard_x), int(keyboard_y)))
-        self.display.display()
+        self.refresh()
         return touchActiveRegions
     
 
-    def draw_xy_plot(self, data: tuple, width: int, height: int, autoscale:bool = True, stroke: tuple = (32,  140,  20)) -> Image.Image:
+    def draw_xy_plot(self, data, width: int, height: int, autoscale:bool = True, stroke: tuple = (32,  140,  20)) -> Image.Image:
+        """Plots data, a sequence or NumPy array of (x, y) pairs sorted by x. Samples are reduced to one
+        per pixel column: the mean is drawn as the line over a band spanning the minimum and maximum."""
 
-        im = Image.new(mode="RGB", size=(width, height), color=(42, 42, 42))
+        BACKGROUND = (42, 42, 42)
+        im = Image.new(mode="RGB", size=(width, height), color=BACKGROUND)
         draw  = ImageDraw.Draw(im)
         font_name = "Roboto-Regular.ttf"
 
@@ -251,51 +1012,45 @@ class ScreenManager:
         AXIS_WIDTH = 1
         TICKS_X = 5
         TICKS_Y = 4
+        ENVELOPE_OPACITY = 0.35
         #### scale data to fit the width
-        #### Resulting 1D list, X remapped to pixels
         height_reserved_for_axis = 10
         width_reserved_for_axis = 18
         width_chartArea = width - width_reserved_for_axis
         height_chartArea = height - height_reserved_for_axis
-        dx = (data[len(data)-1][0]-data[0][0]) / width_chartArea
-
-        data_rescaled = list()
-        sum_y = 0
-        pos_x = 1
-        count_y = 0
-        for i, point in enumerate(data):
-            scaled_x = point[0]/dx
-            if scaled_x < pos_x:
-                sum_y += point[1]
-                count_y += 1
-            else:
-                data_rescaled.append(sum_y/count_y)
-                sum_y = point[1]
-                count_y = 1
-                pos_x += 1
 
-        ##### Scale data in Y to fit in the chart area
+        data = np.asarray(data, dtype=float).reshape(-1, 2)
+        if len(data) == 0:
+            data = np.zeros((1, 2))
+        columns, mean_y, min_y, max_y = downsample(data[:,0], data[:,1], width_chartArea)
+
+        ##### Scale data in Y to fit in the chart area, from the column means, the envelope is only drawn
         Y_MARGINS_RATIO = 0.8
-        min_raw_y = min(data_rescaled) if autoscale else 0
-        max_raw_y = max(data_rescaled)
+        min_raw_y = mean_y.min() if autoscale else 0
+        max_raw_y = mean_y.max()
         ratio_raw_to_pixel = (max_raw_y-min_raw_y) / (Y_MARGINS_RATIO * height_chartArea)
         scale_y_min = (0 - (1-Y_MARGINS_RATIO) * height_chartArea / 2) * ratio_raw_to_pixel + min_raw_y
         scale_y_max = (height_chartArea - (1-Y_MARGINS_RATIO) * height_chartArea / 2) * ratio_raw_to_pixel + min_raw_y
 
-
-        if autoscale:
-            data_rescaled = [point - min_raw_y for point in data_rescaled]
-
-        max_value = max(data_rescaled)
-        if max_value == 0:
-            data_rescaled = [0 for point in data_rescaled]
-        else:
-            data_rescaled = [height-height_reserved_for_axis - int(round(point / max_value * Y_MARGINS_RATIO * height_chartArea + (1 - Y_MARGINS_RATIO) * height_chartArea / 2)) for point in data_rescaled]
-        
-        #### plot the data
-
-        for it in range(1, len(data_rescaled)):
-            draw.line(xy=(it-1+width_reserved_for_axis, data_rescaled[it-1], it+width_reserved_for_axis, data_rescaled[it]), fill=stroke, width=LINE_WIDTH)
+        def to_pixels(values: np.ndarray) -> np.ndarray:
+            if max_raw_y == min_raw_y:
+                values = np.zeros_like(values)
+            else:
+                values = (values - min_raw_y) / (max_raw_y - min_raw_y)
+            pixels = height - height_reserved_for_axis - np.rint(values * Y_MARGINS_RATIO * height_chartArea + (1 - Y_MARGINS_RATIO) * height_chartArea / 2)
+            return np.clip(pixels, 0, height_chartArea)     # peaks of the envelope may fall outside the scale
+        
+        #### plot the data, envelope first, then the mean as a single polyline
+        pixels_x = columns + width_reserved_for_axis
+        upper = list(zip(pixels_x.tolist(), to_pixels(max_y).tolist()))
+        lower = list(zip(pixels_x.tolist(), to_pixels(min_y).tolist()))
+        envelope_colour = tuple(int(b + (s - b) * ENVELOPE_OPACITY) for s, b in zip(stroke, BACKGROUND))
+        if len(upper) > 1:
+            draw.polygon(xy=upper + lower[::-1], fill=envelope_colour, outline=envelope_colour)
+
+        line = list(zip(pixels_x.tolist(), to_pixels(mean_y).tolist()))
+        if len(line) > 1:
+            draw.line(xy=line, fill=stroke, width=LINE_WIDTH)
         
         #### Drawing axis box and ticks
 
@@ -305,7 +1060,7 @@ class ScreenManager:
         tick_distance_x = int(width_chartArea / TICKS_X)
         tick_distance_y = int(height_chartArea / TICKS_Y)
         tick_length = 2 + AXIS_WIDTH
-        font = ImageFont.truetype(font=font_name, size=8)
+        font = get_font(font_name, 8)
 
 
         for it in range(TICKS_X):
@@ -317,7 +1072,7 @@ class ScreenManager:
                         width_reserved_for_axis + (it+1) * tick_distance_x, height-height_reserved_for_axis-tick_length),
                     fill=self.COLOUR_OUTLINE, width=AXIS_WIDTH)
             
-            label = formatTime(data[len(data)-1][0] / (TICKS_X - it))
+            label = formatTime(data[-1, 0] / (TICKS_X - it))
 
             draw.text(xy=(width_reserved_for_axis + (it+1) * tick_distance_x, height),
                     text=label, fill=self.COLOUR_OUTLINE, font=font, anchor="mb" if it+1<TICKS_X else "rb")
@@ -346,14 +1101,14 @@ class ScreenManager:
         self.display.clear(self.COLOUR_BG) 
         touchActiveRegions = tuple()
         
-        font = ImageFont.truetype(font=self.font_name, size=16)
+        font = get_font(self.font_name, 16)
         draw.text(xy = (self.WIDTH / 2, self.MARGIN_SMALL), 
                     text = "Workout History", # Box title
                     fill = self.COLOUR_TEXT_LIGHT,
                     font = font,
                     anchor="mt")
         
-        font = ImageFont.truetype(font=self.font_name, size=10)
+        font = get_font(self.font_name, 10)
         button_mainMenu_xy = (self.MARGIN_SMALL, self.MARGIN_SMALL,
                               self.MARGIN_SMALL + int(font.getlength("Main Menu"))+4, self.MARGIN_SMALL+16)
         button_centre = ((button_mainMenu_xy[2]+button_mainMenu_xy[0])/2, (button_mainMenu_xy[3]+button_mainMenu_xy[1])/2)
@@ -378,10 +1133,10 @@ class ScreenManager:
             draw.rounded_rectangle(xy=box_xy, radius=10, fill=self.COLOUR_BG_LIGHT)
             touchActiveRegions += ((box_xy, lastDisplayedItem-i),)
 
-            font = ImageFont.truetype(font=self.font_name, size=11)
+            font = get_font(self.font_name, 11)
             draw.text(xy=(self.MARGIN_SMALL+10, Y_Pos+8), text=list_of_workouts[lastDisplayedItem-i]["Name"], 
                       font=font, anchor="lt", fill=self.COLOUR_TEXT_LIGHT)
-            font = ImageFont.truetype(font=self.font_name, size=10)
+            font = get_font(self.font_name, 10)
 
             ##### Duration
             draw.text(xy=(self.MARGIN_SMALL+10, Y_Pos+27), text="Duration:", font=font, anchor="lt", fill=self.COLOUR_FILL)
@@ -450,7 +1205,7 @@ class ScreenManager:
             triangle_box = (int(self.WIDTH-30 - triangle_width/2), Y_Pos,  int(self.WIDTH-30 + triangle_width/2), Y_Pos+triangle_height)
             touchActiveRegions += ((triangle_box, "Previous"),)
 
-        self.display.display()
+        self.refresh()
         return touchActiveRegions
     
     
@@ -485,7 +1240,7 @@ class ScreenManager:
         image = Image.new(mode="RGB", size= (image_width, image_height), color=self.COLOUR_BG)
         draw = ImageDraw.Draw(image)
 
-        font = ImageFont.truetype(font=self.font_name, size=14)
+        font = get_font(self.font_name, 14)
         
         line_X_pos_starts = (char_spacing + char_width/2, char_spacing, char_spacing + char_width/2, 2*char_spacing + char_width*3/2)
         
@@ -505,7 +1260,7 @@ class ScreenManager:
 
             Y_pos += char_height + lineSpacing
 
-        font = ImageFont.truetype(font=self.font_name, size=10)
+        font = get_font(self.font_name, 10)
 
         specials_xy = (X_pos, char_height * 3 + lineSpacing * 4, X_pos + 2*char_width, char_height * 4 + lineSpacing * 4)
         specials_centre_xy = (int((specials_xy[0]+specials_xy[2])/2), int((specials_xy[1]+specials_xy[3])/2))
@@ -524,35 +1279,73 @@ class ScreenManager:
     def draw_page_historical_record_details(self, metadata, data, chart1:str, chart2:str) -> tuple:
 
         RAD = 8
+        GAP = 10
+        CHART_HEIGH = 84
+        HEADERS = 20
+        ARROWS_ZONE = 40
+        summary_box_height = 28
 
-        draw = self.display.draw() # Get a PIL Draw object
-        self.display.clear(self.COLOUR_BG) 
-        touchActiveRegions = tuple()
+        font = get_font(self.font_name, 16)
+        summary_Y_Pos = 2 + font.getbbox(text=metadata["Name"],anchor="mt")[3] + 8
+        charts_Y_Pos = summary_Y_Pos + summary_box_height + GAP
 
-        font = ImageFont.truetype(font=self.font_name, size=10)
-        button_mainMenu_xy = (2, 2, 2 + int(font.getlength("Back"))+12, 2+16)
-        button_centre = ((button_mainMenu_xy[2]+button_mainMenu_xy[0])/2, (button_mainMenu_xy[3]+button_mainMenu_xy[1])/2)
-        draw.rounded_rectangle(xy=button_mainMenu_xy, radius=3, fill=self.COLOUR_BG_LIGHT, outline=self.COLOUR_OUTLINE)
-        draw.text(xy=button_centre, text="Back", anchor="mm", font=font, fill=self.COLOUR_TEXT_LIGHT, align="center")
-        touchActiveRegions += ((button_mainMenu_xy, "Back"),)
+        def draw_static(draw: ImageDraw.ImageDraw) -> tuple:
+            touchActiveRegions = tuple()
 
-        button_export_xy = (self.WIDTH - 2 - int(font.getlength("Export"))-12, 2, self.WIDTH-2, 2+16)
-        button_export_centre = ((button_export_xy[2]+button_export_xy[0])/2, (button_export_xy[3]+button_export_xy[1])/2)
-        draw.rounded_rectangle(xy=button_export_xy, radius=3, fill=self.COLOUR_BG_LIGHT, outline=self.COLOUR_OUTLINE)
-        draw.text(xy=button_export_centre, text="Export", anchor="mm", font=font, fill=self.COLOUR_TEXT_LIGHT, align="center")
-        touchActiveRegions += ((button_export_xy, "Export"),)
+            font = get_font(self.font_name, 10)
+            button_mainMenu_xy = (2, 2, 2 + int(font.getlength("Back"))+12, 2+16)
+            button_centre = ((button_mainMenu_xy[2]+button_mainMenu_xy[0])/2, (button_mainMenu_xy[3]+button_mainMenu_xy[1])/2)
+            draw.rounded_rectangle(xy=button_mainMenu_xy, radius=3, fill=self.COLOUR_BG_LIGHT, outline=self.COLOUR_OUTLINE)
+            draw.text(xy=button_centre, text="Back", anchor="mm", font=font, fill=self.COLOUR_TEXT_LIGHT, align="center")
+            touchActiveRegions += ((button_mainMenu_xy, "Back"),)
 
+            button_export_xy = (self.WIDTH - 2 - int(font.getlength("Export"))-12, 2, self.WIDTH-2, 2+16)
+            button_export_centre = ((button_export_xy[2]+button_export_xy[0])/2, (button_export_xy[3]+button_export_xy[1])/2)
+            draw.rounded_rectangle(xy=button_export_xy, radius=3, fill=self.COLOUR_BG_LIGHT, outline=self.COLOUR_OUTLINE)
+            draw.text(xy=button_export_centre, text="Export", anchor="mm", font=font, fill=self.COLOUR_TEXT_LIGHT, align="center")
+            touchActiveRegions += ((button_export_xy, "Export"),)
+
+            draw.rounded_rectangle(xy=(2, summary_Y_Pos, self.WIDTH-2, summary_Y_Pos+summary_box_height), fill=self.COLOUR_BG_LIGHT, radius=RAD)
+
+            Y_Pos = charts_Y_Pos
+            for _ in range(2):
+                draw.rounded_rectangle(xy=(2, Y_Pos, self.WIDTH-ARROWS_ZONE, Y_Pos+CHART_HEIGH), fill=self.COLOUR_BG_LIGHT,radius=RAD)
+                draw.text(xy=(90, Y_Pos+14), text="Max:", anchor="ls", fill=self.COLOUR_FILL, font=font)
+                draw.text(xy=(150, Y_Pos+14), text="Average:", anchor="ls", fill=self.COLOUR_FILL, font=font)
+                Y_Pos+=CHART_HEIGH+GAP
+
+            Y_Pos = int(Y_Pos - 1.6 * (CHART_HEIGH+GAP))
+            arrow_centre = self.WIDTH-ARROWS_ZONE/2
+            arrow_width = 10
+            arrow_height = 15
+
+            draw.polygon(xy=(arrow_centre, Y_Pos, 
+                            arrow_centre-arrow_width/2, Y_Pos+arrow_height, 
+                            arrow_centre+arrow_width/2, Y_Pos+arrow_height),
+                        fill=self.COLOUR_BUTTON)
+            arrow_box = (arrow_centre-arrow_width/2, Y_Pos, arrow_centre+arrow_width/2, Y_Pos+arrow_height)
+            touchActiveRegions += ((arrow_box, "Previous"),)
+            
+
+            Y_Pos += CHART_HEIGH+GAP
+            draw.polygon(xy=(arrow_centre-arrow_width/2, Y_Pos,
+                            arrow_centre+arrow_width/2, Y_Pos,
+                            arrow_centre, Y_Pos+ arrow_height),
+                        fill=self.COLOUR_BUTTON)
+            
+            arrow_box = (arrow_centre-arrow_width/2, Y_Pos, arrow_centre+arrow_width/2, Y_Pos+arrow_height)
+            touchActiveRegions += ((arrow_box, "Next"),)
+
+            return touchActiveRegions
+
+        touchActiveRegions = self.paste_static_layer(("HistoryDetails", summary_Y_Pos), draw_static)
+        draw = self.display.draw() # Get a PIL Draw object
+
+        font = get_font(self.font_name, 16)
+        draw.text(xy = (self.WIDTH / 2, 2), text = metadata["Name"], fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="mt")
         
-        font = ImageFont.truetype(font=self.font_name, size=16)
-        Y_Pos = 2
-        draw.text(xy = (self.WIDTH / 2, Y_Pos), text = metadata["Name"], fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="mt")
-        
-        Y_Pos += font.getbbox(text=metadata["Name"],anchor="mt")[3] + 8
-        summary_box_height = 28
-        draw.rounded_rectangle(xy=(2, Y_Pos, self.WIDTH-2, Y_Pos+summary_box_height), fill=self.COLOUR_BG_LIGHT, radius=RAD)
-        
-        font = ImageFont.truetype(font=self.font_name, size=10)
-        Y_Pos_box = Y_Pos+16
+        font = get_font(self.font_name, 10)
+        Y_Pos_box = summary_Y_Pos+16
         X_Pos_box = 8
         draw.text(xy=(X_Pos_box, Y_Pos_box), text="Duration:", font=font, anchor="ls", fill=self.COLOUR_FILL)
         try:
@@ -582,72 +1375,37 @@ class ScreenManager:
         draw.text(xy=(X_Pos_box, Y_Pos_box), text=energy, font=font, anchor="ls", fill=self.COLOUR_OUTLINE)
         X_Pos_box += font.getlength(text=energy) + 12
 
-        GAP = 10
-        CHART_HEIGH = 84
-        HEADERS = 20
-        ARROWS_ZONE = 40
+        Y_Pos = charts_Y_Pos
         
+        def as_float(value) -> float:
+            try:
+                return float(value)
+            except:
+                return 0
 
-        Y_Pos += summary_box_height+GAP
-        
-        def slicer(data, key:str) -> tuple:
-            sliced_data = tuple()
-            for line in data:
-                try:
-                    x = float(line["T"])
-                except:
-                    x = 0
-                try:
-                    y = float(line[key])
-                except:
-                    y = 0
+        def column(data, key:str) -> np.ndarray:
+            values = [line.get(key) for line in data]
+            try:
+                return np.asarray(values, dtype=float)
+            except (TypeError, ValueError):     # blank or damaged entries are plotted as 0
+                return np.array([as_float(value) for value in values], dtype=float)
 
-                sliced_data += ((x, y),)
-            return sliced_data
+        time_column = column(data, "T")
+        def slicer(data, key:str) -> np.ndarray:
+            return np.column_stack((time_column, column(data, key)))
         
-        font = ImageFont.truetype(font=self.font_name, size=10)    
         chart_keys = (chart1, chart2)
         charts = [self.draw_xy_plot(slicer(data, chart), self.WIDTH-ARROWS_ZONE-RAD-2, CHART_HEIGH - HEADERS, True) for chart in chart_keys]
 
         for ch, key in zip(charts, chart_keys):
-            draw.rounded_rectangle(xy=(2, Y_Pos, self.WIDTH-ARROWS_ZONE, Y_Pos+CHART_HEIGH), fill=self.COLOUR_BG_LIGHT,radius=RAD)
             self.display.buffer.paste(ch, box=(2, Y_Pos+HEADERS))
-            X_Pos_box = 10
-            draw.text(xy=(X_Pos_box, Y_Pos+14), text=key, anchor="ls", fill=self.COLOUR_FILL, font=font)
-            X_Pos_box += 80
-            draw.text(xy=(X_Pos_box, Y_Pos+14), text="Max:", anchor="ls", fill=self.COLOUR_FILL, font=font)
-            X_Pos_box += 25
-            draw.text(xy=(X_Pos_box, Y_Pos+14), text=str(round(float(metadata["Max"][key]))), anchor="ls", fill=self.COLOUR_OUTLINE, font=font)
-            X_Pos_box += 35
-            draw.text(xy=(X_Pos_box, Y_Pos+14), text="Average:", anchor="ls", fill=self.COLOUR_FILL, font=font)
-            X_Pos_box += 42
-            draw.text(xy=(X_Pos_box, Y_Pos+14), text=str(round(float(metadata["Averages"][key]),1)), anchor="ls", fill=self.COLOUR_OUTLINE, font=font)
+            draw.text(xy=(10, Y_Pos+14), text=key, anchor="ls", fill=self.COLOUR_FILL, font=font)
+            draw.text(xy=(115, Y_Pos+14), text=str(round(float(metadata["Max"][key]))), anchor="ls", fill=self.COLOUR_OUTLINE, font=font)
+            draw.text(xy=(192, Y_Pos+14), text=str(round(float(metadata["Averages"][key]),1)), anchor="ls", fill=self.COLOUR_OUTLINE, font=font)
 
             Y_Pos+=CHART_HEIGH+GAP
-
-        Y_Pos = int(Y_Pos - 1.6 * (CHART_HEIGH+GAP))
-        arrow_centre = self.WIDTH-ARROWS_ZONE/2
-        arrow_width = 10
-        arrow_height = 15
-
-        draw.polygon(xy=(arrow_centre, Y_Pos, 
-                        arrow_centre-arrow_width/2, Y_Pos+arrow_height, 
-                        arrow_centre+arrow_width/2, Y_Pos+arrow_height),
-                    fill=self.COLOUR_BUTTON)
-        arrow_box = (arrow_centre-arrow_width/2, Y_Pos, arrow_centre+arrow_width/2, Y_Pos+arrow_height)
-        touchActiveRegions += ((arrow_box, "Previous"),)
-        
-
-        Y_Pos += CHART_HEIGH+GAP
-        draw.polygon(xy=(arrow_centre-arrow_width/2, Y_Pos,
-                        arrow_centre+arrow_width/2, Y_Pos,
-                        arrow_centre, Y_Pos+ arrow_height),
-                    fill=self.COLOUR_BUTTON)
-        
-        arrow_box = (arrow_centre-arrow_width/2, Y_Pos, arrow_centre+arrow_width/2, Y_Pos+arrow_height)
-        touchActiveRegions += ((arrow_box, "Next"),)
                         
-        self.display.display()
+        self.refresh()
 
         return touchActiveRegions
 
@@ -657,7 +1415,7 @@ class ScreenManager:
         draw = self.display.draw() # Get a PIL Draw object
         self.display.clear(self.COLOUR_BG) 
         #draw = ImageDraw.Draw(self.im)
-        font = ImageFont.truetype(font=self.font_name, size=14)
+        font = get_font(self.font_name, 14)
 
         touchActiveRegions = tuple()
         
@@ -696,7 +1454,7 @@ class ScreenManager:
 
         button_label = "Finish"
         
-        font = ImageFont.truetype(font=self.font_name, size=10)
+        font = get_font(self.font_name, 10)
 
         button_xy = (X_Pos, Y_Pos)
         button_xy += (button_xy[0] + button_dims[0], button_xy[1] + button_dims[1])
@@ -714,12 +1472,12 @@ class ScreenManager:
 
         for label, unit, Xoffset, size, value, in zip(paramsLabels, paramsUnits, paramsXoffsets, paramsFontSize, program.getParameters()):
             
-            font = ImageFont.truetype(font=self.font_name, size=8)
+            font = get_font(self.font_name, 8)
             draw.text(xy=(X_Pos, Y_Pos), text=label, fill=self.COLOUR_TEXT_LIGHT, font=font)
             Y_Pos_start = Y_Pos
             Y_Pos += 13
 
-            font = ImageFont.truetype(font=self.font_name, size=size)
+            font = get_font(self.font_name, size)
             draw.text(xy=(X_Pos + Xoffset, Y_Pos), text=str(value)+unit, fill=self.COLOUR_OUTLINE, font=font)
             
             text_length = int(max(font.getlength(text=label), font.getlength(text=str(value)+unit)))
@@ -729,7 +1487,7 @@ class ScreenManager:
             Y_Pos += 13
 
 
-        font = ImageFont.truetype(font=self.font_name, size=10)
+        font = get_font(self.font_name, 10)
         button_label = tuple()
         if selected_segment is None:
             button_label += ("Add",)
@@ -760,7 +1518,7 @@ class ScreenManager:
             touchActiveRegions += ((button_xy, label),)
 
         ## central edit box
-        font = ImageFont.truetype(font=self.font_name, size=10)
+        font = get_font(self.font_name, 10)
 
         box_wd = (140, 110)
         box_xy = (self.WIDTH / 2 - box_wd[0] / 2, 28)
@@ -848,7 +1606,7 @@ class ScreenManager:
                 X_Pos -= 3*26
 
 
-        self.display.display()
+        self.refresh()
 
         return touchActiveRegions
     
@@ -858,14 +1616,14 @@ class ScreenManager:
         self.display.clear(self.COLOUR_BG) 
         touchActiveRegions = tuple()
 
-        font = ImageFont.truetype(font=self.font_name, size=10)
+        font = get_font(self.font_name, 10)
         button_mainMenu_xy = (2, 2, 2 + int(font.getlength("Back"))+12, 2+16)
         button_centre = ((button_mainMenu_xy[2]+button_mainMenu_xy[0])/2, (button_mainMenu_xy[3]+button_mainMenu_xy[1])/2)
         draw.rounded_rectangle(xy=button_mainMenu_xy, radius=3, fill=self.COLOUR_BG_LIGHT, outline=self.COLOUR_OUTLINE)
         draw.text(xy=button_centre, text="Back", anchor="mm", font=font, fill=self.COLOUR_TEXT_LIGHT, align="center")
         touchActiveRegions += ((button_mainMenu_xy, "Back"),)
 
-        font = ImageFont.truetype(font=self.font_name, size=16)
+        font = get_font(self.font_name, 16)
         Y_Pos = self.MARGIN_LARGE
         draw.text(xy = (self.WIDTH / 2, Y_Pos), text = device_type, fill =self.COLOUR_TEXT_LIGHT, font = font, anchor="mt")
         
@@ -876,7 +1634,7 @@ class ScreenManager:
             draw.text(xy=button_centre, text="Re-scan", anchor="mm", font=font, fill=self.COLOUR_TEXT_LIGHT, align="center")
             touchActiveRegions += ((button_rescan_xy, "Rescan"),)
 
-            font = ImageFont.truetype(font=self.font_name, size=12)
+            font = get_font(self.font_name, 12)
 
             box_height = 30
             box_width = 250
@@ -934,7 +1692,7 @@ class ScreenManager:
             draw.rounded_rectangle(xy=(self.MARGIN_LARGE, 80, self.MARGIN_LARGE+box_width_filled, 120), radius=8, 
                                    fill= self.COLOUR_OUTLINE)
         
-        self.display.display()
+        self.refresh()
 
         return touchActiveRegions
 
@@ -947,7 +1705,7 @@ class ScreenManager:
         #draw = ImageDraw.Draw(self.im)
         touchActiveRegions = tuple()
 
-        font = ImageFont.truetype(font=self.font_name, size=18)
+        font = get_font(self.font_name, 18)
         draw.text(xy=(self.WIDTH/2, self.MARGIN_LARGE), text="WiFi Settings", font=font, anchor="mm", fill=self.COLOUR_TEXT_LIGHT)
 
         box_height = 30
@@ -956,12 +1714,12 @@ class ScreenManager:
         RADIUS = 8
         Y_Pos = 45
         box_setting_x = 180
-        font = ImageFont.truetype(font=self.font_name, size=14)
+        font = get_font(self.font_name, 14)
         draw.text(xy=(int(self.MARGIN_SMALL + box_width/2), Y_Pos), text="Available:", font=font, anchor="mm", fill=self.COLOUR_OUTLINE)
         draw.text(xy=(int((box_setting_x + self.WIDTH-self.MARGIN_SMALL)/2), Y_Pos), text="Settings:", font=font, anchor="mm", fill=self.COLOUR_OUTLINE)
 
         Y_Pos = 60
-        font = ImageFont.truetype(font=self.font_name, size=12)
+        font = get_font(self.font_name, 12)
         buttons_labels = ("Discard", "Save")
         buttons_width = max([font.getlength(item) for item in buttons_labels])+6
         buttons_xpos=(self.MARGIN_SMALL, self.WIDTH-2*self.MARGIN_SMALL-buttons_width)
@@ -1045,7 +1803,7 @@ class ScreenManager:
         draw.text(xy=self.calculate_centre_xy(button_xy), text=text, font=font, anchor="mm", fill=self.COLOUR_FILL)
         touchActiveRegions += ((button_xy, text),)
         
-        self.display.display()
+        self.refresh()
         #self.im.show()
         return touchActiveRegions
     
@@ -1056,7 +1814,7 @@ class ScreenManager:
         self.display.buffer = self.display.buffer.convert("RGB")
 
         draw = self.display.draw() # Get a PIL Draw object
-        font = ImageFont.truetype(font=self.font_name, size=12)
+        font = get_font(self.font_name, 12)
         touchActiveRegions = tuple()
         
         numberOfButtons = len(options)
@@ -1077,7 +1835,7 @@ class ScreenManager:
 
         draw.text(xy=(self.WIDTH/2, self.HEIGHT/2+12), text=message, font=font, fill=self.COLOUR_TEXT_LIGHT, anchor="mm")
         
-        font = ImageFont.truetype(font=self.font_name, size=10)
+        font = get_font(self.font_name, 10)
 
         X_pos = box_xy[0] + marginLength 
         Y_pos = box_xy[1] + 25
@@ -1089,7 +1847,7 @@ class ScreenManager:
             X_pos += buttonLength+marginLength
             touchActiveRegions += ((button_xy, opt),)
 
-        self.display.display()
+        self.refresh()
         return touchActiveRegions
 
     def drawProgramSelector(self, listOfParametres: list, previousEnabled: bool = False, 
@@ -1098,7 +1856,7 @@ class ScreenManager:
         self.display.clear(self.COLOUR_BG)
         draw = self.display.draw() # Get a PIL Draw object
         #draw = ImageDraw.Draw(self.im)
-        font = ImageFont.truetype(font=self.font_name, size=14)
+        font = get_font(self.font_name, 14)
         draw.text(xy = (self.WIDTH / 2, self.MARGIN_SMALL), text = "Select program", fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="mt")
 
         touchActiveRegions = tuple()
@@ -1133,7 +1891,7 @@ class ScreenManager:
 
         if newProgramEnabled == True:
 
-            font = ImageFont.truetype(font=self.font_name, size=10)
+            font = get_font(self.font_name, 10)
             newButtonWidth = 70
             newButtonHeigh = 14
             newButtonStartX = 30
@@ -1177,7 +1935,7 @@ class ScreenManager:
 
                 touchActiveRegions += ((box_xy, progID),)
 
-                font = ImageFont.truetype(font=self.font_name, size=12)
+                font = get_font(self.font_name, 12)
                 draw.text(xy = (self.MARGIN_LARGE + X_offset, self.MARGIN_SMALL+Y_offset), 
                             text =  thisWorkoutParams.name, # Box title
                             fill = self.COLOUR_TEXT_LIGHT,
@@ -1186,7 +1944,7 @@ class ScreenManager:
                 
                 
                 Y_offset += 18
-                font = ImageFont.truetype(font=self.font_name, size=8)
+                font = get_font(self.font_name, 8)
                 draw.text(xy = (self.MARGIN_LARGE + X_offset, self.MARGIN_SMALL+Y_offset), 
                             text = "Time", # Box title
                             fill = self.COLOUR_TEXT_LIGHT,
@@ -1257,7 +2015,7 @@ class ScreenManager:
 
             X_offset_start += self.WIDTH / 2
 
-        self.display.display()
+        self.refresh()
         return touchActiveRegions
     
 
@@ -1271,50 +2029,21 @@ class ScreenManager:
                           selectedSegment: int = None,
                           segment_completion = None) -> tuple:
         
-        image = Image.new('RGB', (chartWidth, chartHeight), bgColour)
-        draw = ImageDraw.Draw(image)
-
-        noSegments = len(workoutParams.segmentsChartData)
-        segment_width_normalisation_factor  = workoutParams.totalDuration / (chartWidth - noSegments * 2)
-        segment_height_normalisation_factor = workoutParams.maxPower / chartHeight 
-
-        if segment_height_normalisation_factor == 0:
-            segment_height_normalisation_factor = 1
-
-        barHeightAdjustment: int = 0
-        minBarHeight = int(workoutParams.minPower / segment_height_normalisation_factor) +1
-        if minBarHeight > chartHeight / 5:
-            barHeightAdjustment = minBarHeight - chartHeight / 5
-        
-        maxBarHeight = int(workoutParams.maxPower / segment_height_normalisation_factor) +1 - barHeightAdjustment
-        barHeightScaler = chartHeight / maxBarHeight * 0.9
-
-        chartXPos = 0
-
-        touchActiveRegions = tuple()
-
-        for counter, segment in enumerate(workoutParams.segmentsChartData):
-
-            if selectedSegment == counter and selectionColour is not None:
-                colour = selectionColour
-            else:
-                colour = segmentsColour
-
-            segment_wh = (int(segment[2] / segment_width_normalisation_factor) + 1,
-                         int((segment[1] / segment_height_normalisation_factor +1 - barHeightAdjustment) * barHeightScaler))
+        base, touchActiveRegions = render_segments_chart(chartWidth, chartHeight, tuple(workoutParams.segmentsChartData),
+                                                         workoutParams.totalDuration, workoutParams.maxPower, workoutParams.minPower,
+                                                         bgColour, segmentsColour)
+        image = base.copy()
 
+        #### Selection and progress are drawn over a copy of the cached chart
+        if selectedSegment is not None and 0 <= selectedSegment < len(touchActiveRegions):
+            segment_xy = touchActiveRegions[selectedSegment][0]
+            draw = ImageDraw.Draw(image)
             
-            segment_xy = (chartXPos, chartHeight-segment_wh[1], chartXPos + segment_wh[0], chartHeight)
-            
-            draw.rectangle(xy=segment_xy, fill=colour)
-            if selectedSegment == counter and segment_completion is not None:
-                draw.line(xy=(int(chartXPos + segment_completion * segment_wh[0]), chartHeight-segment_wh[1],
-                              int(chartXPos + segment_completion * segment_wh[0]), chartHeight),
-                              width=1, fill= self.COLOUR_CLIMBER)
-
-            touchActiveRegions += ((segment_xy, counter),)
-
-            chartXPos += segment_wh[0] + 2
+            if selectionColour is not None:
+                draw.rectangle(xy=segment_xy, fill=selectionColour)
+            if segment_completion is not None:
+                line_x = int(segment_xy[0] + segment_completion * (segment_xy[2] - segment_xy[0]))
+                draw.line(xy=(line_x, segment_xy[1], line_x, segment_xy[3]), width=1, fill= self.COLOUR_CLIMBER)
 
         return (image, touchActiveRegions)
 
@@ -1335,26 +2064,19 @@ class ScreenManager:
         draw.line(xy=((point_x, point_y - LINE_LENGTH - GAP), (point_x, point_y - GAP)), fill=self.COLOUR_OUTLINE, width=1)
         draw.line(xy=((point_x, point_y + GAP), (point_x, point_y + LINE_LENGTH + GAP)), fill=self.COLOUR_OUTLINE, width=1)
 
-        font = ImageFont.truetype(font=self.font_name, size=14)
+        font = get_font(self.font_name, 14)
         draw.text(xy=(self.WIDTH/2, self.HEIGHT/2), text="Touch the screen\nat the indicated spot", 
                   align="center", anchor="mm", fill=self.COLOUR_FILL, font=font)
 
-        self.display.display()
+        self.refresh()
         #self.im.show()
 
     def calculate_centre_xy(self, xy:tuple) -> tuple:
         return ((xy[2] + xy[0])/2, (xy[3] + xy[1])/2)
 
-
     def drawPageWorkout(self, workoutType:str, workoutState: str, workoutParams: WorkoutParameters,
                         multiplier: int, selectedSegment:int = None, state_of_charge:int = None) -> tuple:
 
-        self.display.clear(self.COLOUR_BG)
-        draw = self.display.draw() # Get a PIL Draw object
-        #self.im = Image.new("RGB", (320,240), self.COLOUR_BG)
-        #draw = ImageDraw.Draw(self.im)
-        touchActiveRegions = tuple()
-
         LINE_THICKNESS: int = 2
         Y_POS_SECTIONS = int(self.HEIGHT / 4)    # Sections begin at 1/4 height, i.e. 240 / 4 = 60
 
@@ -1369,80 +2091,8 @@ class ScreenManager:
                                             formatTime(self.dataContainer.currentSegment.duration - self.dataContainer.currentSegment.elapsedTime))
                         )
         
-        for i in range(noBoxes):
-            box_xy = (self.MARGIN_LARGE + i * (box_width + self.MARGIN_LARGE), 0,
-                    self.MARGIN_LARGE + i * (box_width + self.MARGIN_LARGE) + box_width, self.MARGIN_SMALL+box_height)
-            
-            box_centre_xy = self.calculate_centre_xy(box_xy)
-            
-            font = ImageFont.truetype(font=self.font_name, size=12)
-            
-            draw.text(xy = (box_centre_xy[0], box_xy[1]+3), text = box_Labels[i][0], # Box title
-                    fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="mt")
-            
-            if i == 1:  # central box, 
-                
-                if workoutState == "FREERIDE" or workoutState == "PROGRAM":
-                    button_label = "Pause"
-                else:
-                    button_label = "Resume" 
-                
-                button_dims = (font.getlength(button_label)+4, 20)
-                button_x_separation = 14
-                
-                button_xy = ((self.WIDTH / 2 - button_dims[0] - button_x_separation/2), (Y_POS_SECTIONS - button_dims[1]) / 2 + 8,
-                            (self.WIDTH / 2 - button_x_separation/2), (Y_POS_SECTIONS + button_dims[1]) / 2 + 8)
-                                        
-                button_centre = self.calculate_centre_xy(button_xy)
-                draw.rounded_rectangle(xy = button_xy, radius = 3, fill = self.COLOUR_BUTTON, 
-                                        outline = self.COLOUR_BUTTON, width = 2)
-                draw.text(xy = button_centre, text = button_label, fill = self.COLOUR_FILL, font = font, anchor="mm")
-                touchActiveRegions += ((button_xy, button_label),)
-
-
-                button_xy = ((self.WIDTH / 2 + button_x_separation/2), (Y_POS_SECTIONS - button_dims[1]) / 2 + 8,
-                                (self.WIDTH / 2 + button_x_separation/2 + button_dims[0]), (Y_POS_SECTIONS + button_dims[1]) / 2 + 8)
-                
-                button_centre = self.calculate_centre_xy(button_xy)
-
-                draw.rounded_rectangle(xy = button_xy, radius = 3, fill = self.COLOUR_BUTTON,
-                                        outline = self.COLOUR_BUTTON, width = 2)
-                
-                touchActiveRegions += ((button_xy, "End"),)
-                draw.text(xy = button_centre, text = "End", fill = self.COLOUR_FILL, font = font, anchor="mm")
-
-                # no extra info to print, skip the rest of the iteration
-                continue
-
-            font = ImageFont.truetype(font=self.font_name, size=11)
-
-            valuesOffset = max([font.getlength(opt) for opt in ("Segment:", "Total:", "  ")]) + 6
-
-            draw.text(xy = (box_centre_xy[0] - box_width / 2 , box_centre_xy[1]+8), 
-                    text = "Total:", # total
-                    fill = self.COLOUR_TEXT_LIGHT,
-                    font = font,
-                    anchor="lm")
-
-            draw.text(xy = (int(box_centre_xy[0] - box_width / 2 + valuesOffset), box_centre_xy[1]+8), 
-                    text = str(box_Labels[i][1]), # total
-                    fill = self.COLOUR_OUTLINE,
-                    font = font,
-                    anchor="lm")
-
-            draw.text(xy = (box_centre_xy[0] - box_width / 2, box_centre_xy[1]+24), 
-                    text = "Segment: ",
-                    fill = self.COLOUR_TEXT_LIGHT,
-                    font = font,
-                    anchor="lm")
-
-            draw.text(xy = (box_centre_xy[0] - box_width / 2 + valuesOffset, box_centre_xy[1]+24), 
-                    text = str(box_Labels[i][2]), # Segment
-                    fill = self.COLOUR_OUTLINE,
-                    font = font,
-                    anchor="lm")
-
-        Y_Pos: int = Y_POS_SECTIONS
+        box_xys = [(self.MARGIN_LARGE + i * (box_width + self.MARGIN_LARGE), 0,
+                    self.MARGIN_LARGE + i * (box_width + self.MARGIN_LARGE) + box_width, self.MARGIN_SMALL+box_height) for i in range(noBoxes)]
 
         section1: dict = {"Section": "Speed", "Unit": "km/h", 
                     "Value": str(round(self.dataContainer.momentary.speed,1)), 
@@ -1467,28 +2117,162 @@ class ScreenManager:
 
         all_sections: tuple = (section1, section2, section3, section4)
         section_height = self.HEIGHT * 3 / 4 / len(all_sections)
+        box_centre_x = (204 + self.MARGIN_SMALL + self.WIDTH)/2
+
+        #### Live power and heart rate charts in the right panel, one column per second,
+        #### between the difficulty control and the segments chart
+        live_chart_titles = ("Power", "Heart Rate")
+        live_chart_tops = (Y_POS_SECTIONS + 48, Y_POS_SECTIONS + 85)
+        live_chart_x = 204 + 2 * self.MARGIN_SMALL
+        live_chart_size = (self.WIDTH - live_chart_x - self.MARGIN_SMALL, 20)
+        difficulty_y = Y_POS_SECTIONS + 30      # centre of the arrows and the multiplier
+
+        #### Titles, labels and panel backgrounds never change for a workout type
+        def draw_static(draw: ImageDraw.ImageDraw) -> tuple:
+            touchActiveRegions = tuple()
+
+            for i, box_xy in enumerate(box_xys):
+                box_centre_xy = self.calculate_centre_xy(box_xy)
+                
+                font = get_font(self.font_name, 12)
+                
+                draw.text(xy = (box_centre_xy[0], box_xy[1]+3), text = box_Labels[i][0], # Box title
+                        fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="mt")
+                
+                if i == 1:  # central box holds the buttons only
+                    continue
+
+                font = get_font(self.font_name, 11)
+
+                draw.text(xy = (box_centre_xy[0] - box_width / 2 , box_centre_xy[1]+8), 
+                        text = "Total:", # total
+                        fill = self.COLOUR_TEXT_LIGHT,
+                        font = font,
+                        anchor="lm")
+
+                draw.text(xy = (box_centre_xy[0] - box_width / 2, box_centre_xy[1]+24), 
+                        text = "Segment: ",
+                        fill = self.COLOUR_TEXT_LIGHT,
+                        font = font,
+                        anchor="lm")
+
+            Y_Pos = Y_POS_SECTIONS
+            draw.rounded_rectangle(xy= (0, Y_Pos, 204, self.HEIGHT), radius=8, fill=self.COLOUR_BG_LIGHT)
+            for section in all_sections:
+                
+                X_Pos: int = self.MARGIN_SMALL*2
 
-        draw.rounded_rectangle(xy= (0, Y_Pos, 204, self.HEIGHT), radius=8, fill=self.COLOUR_BG_LIGHT)
-        for section in all_sections:
-            
-            X_Pos: int = self.MARGIN_SMALL*2
+                font = get_font(self.font_name, 11)
 
-            font = ImageFont.truetype(font=self.font_name, size=11)
+                draw.text(xy = (X_Pos, Y_Pos + section_height / 2), text = section["Section"],
+                        fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="lm", align="center")
+                
+                font = get_font(self.font_name, 10)
+                X_Pos += 90
+                draw.text(xy = (X_Pos, Y_Pos + section_height / 2), text = section["Unit"], 
+                        fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="mm")
+
+                Y_Pos += section_height
+                draw.line(xy = (self.MARGIN_SMALL, Y_Pos, 204-self.MARGIN_SMALL, Y_Pos), fill  = self.COLOUR_OUTLINE, width = LINE_THICKNESS)
+
+            Y_Pos = Y_POS_SECTIONS
+            X_Pos = 204 + self.MARGIN_SMALL
+            draw.rounded_rectangle(xy= (X_Pos, Y_Pos, self.WIDTH, self.HEIGHT), radius=8, fill=self.COLOUR_BG_LIGHT)
+
+            if workoutType == "Program":
+                Y_Pos += 4
+                font = get_font(self.font_name, 12)
+                draw.text(xy = (box_centre_x, Y_Pos), text = "Difficulty", 
+                        fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="ma")
+                
+                #### decrease on the left, increase on the right of the multiplier
+                arrow_w = 6
+                arrow_h = 16
+                arrow_x = live_chart_x + arrow_w
+                Y_Pos = difficulty_y - arrow_h / 2
+                draw.polygon(xy=(arrow_x-arrow_w, Y_Pos, arrow_x+arrow_w, Y_Pos, arrow_x, Y_Pos+arrow_h), fill=self.COLOUR_BUTTON)
+                arrow_box = (arrow_x-2*arrow_w, Y_Pos-6, arrow_x+3*arrow_w, Y_Pos+arrow_h+6)
+                touchActiveRegions += ((arrow_box, "Decrease"),)
+
+                arrow_x = live_chart_x + live_chart_size[0] - arrow_w
+                draw.polygon(xy=(arrow_x, Y_Pos, arrow_x-arrow_w, Y_Pos+arrow_h, arrow_x+arrow_w, Y_Pos+arrow_h), fill=self.COLOUR_BUTTON)
+                arrow_box = (arrow_x-3*arrow_w, Y_Pos-6, arrow_x+2*arrow_w, Y_Pos+arrow_h+6)
+                touchActiveRegions += ((arrow_box, "Increase"),)
+
+            font = get_font(self.font_name, 11)
+            for title, top in zip(live_chart_titles, live_chart_tops):
+                draw.text(xy = (live_chart_x, top), text = title, fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="la")
+
+            return touchActiveRegions
+
+        page = ("Workout", workoutType)
+        compositor: Compositor = self.compositors.get(page)
+        if compositor is None:
+            compositor = Compositor(*self.static_layer(page, draw_static))
+            font = get_font(self.font_name, 12)
+            compositor.add("pause", Button((0, 0, 0, 0), "Pause", font, self.COLOUR_BUTTON, self.COLOUR_FILL))
+            compositor.add("end", Button((0, 0, 0, 0), "End", font, self.COLOUR_BUTTON, self.COLOUR_FILL))
+
+            font = get_font(self.font_name, 11)
+            valuesOffset = max([font.getlength(opt) for opt in ("Segment:", "Total:", "  ")]) + 6
+            for i, name in ((0, "elapsed"), (2, "remaining")):
+                box_centre_xy = self.calculate_centre_xy(box_xys[i])
+                compositor.add(name+"_total", Readout((int(box_centre_xy[0] - box_width / 2 + valuesOffset), box_centre_xy[1]+8),
+                                                    "", font, self.COLOUR_OUTLINE, "lm"))
+                compositor.add(name+"_segment", Readout((box_centre_xy[0] - box_width / 2 + valuesOffset, box_centre_xy[1]+24),
+                                                      "", font, self.COLOUR_OUTLINE, "lm"))
+            
+            Y_Pos = Y_POS_SECTIONS
+            X_Pos = self.MARGIN_SMALL*2 + 90
+            for i, section in enumerate(all_sections):
+                if "Zone" in section:
+                    compositor.add("zone", Label((X_Pos, Y_Pos + section_height / 4 *2.8), "", None, self.COLOUR_TEXT_LIGHT, "mm"))
+                compositor.add("value"+str(i), Readout((X_Pos + 60, Y_Pos+15), "", get_font(self.font_name, 16), self.COLOUR_TEXT_LIGHT, "mm"))
+                compositor.add("stats"+str(i), Readout((X_Pos + 60, Y_Pos+section_height / 4 * 3), "", get_font(self.font_name, 8), self.COLOUR_TEXT_LIGHT, "mm"))
+                Y_Pos += section_height
+
+            if workoutType == "Program":
+                compositor.add("multiplier", Readout((box_centre_x, difficulty_y), "", get_font(self.font_name, 14), self.COLOUR_OUTLINE, "mm"))
+                compositor.add("segments", Chart((204 + 2 * self.MARGIN_SMALL, self.HEIGHT - self.MARGIN_SMALL - 50)))
+
+            font = get_font(self.font_name, 10)
+            for name, top, colour, value_range in (("power", live_chart_tops[0], self.COLOUR_OUTLINE, (0, 300)),
+                                                   ("heart_rate", live_chart_tops[1], self.COLOUR_HEART, (40, 180))):
+                compositor.add(name+"_scale", Readout((live_chart_x + live_chart_size[0], top), "", font, self.COLOUR_TEXT_LIGHT, "ra"))
+                compositor.add(name+"_chart", LiveChart((live_chart_x, top + 14), live_chart_size, colour,
+                                                        tuple(c // 3 + b * 2 // 3 for c, b in zip(colour, self.COLOUR_BG_LIGHT)),
+                                                        self.COLOUR_BG_LIGHT, value_range))
+
+            self.compositors[page] = compositor
+
+        if workoutState == "FREERIDE" or workoutState == "PROGRAM":
+            button_label = "Pause"
+        else:
+            button_label = "Resume" 
+        
+        font = get_font(self.font_name, 12)
+        button_dims = (font.getlength(button_label)+4, 20)
+        button_x_separation = 14
+        
+        button_xy = ((self.WIDTH / 2 - button_dims[0] - button_x_separation/2), (Y_POS_SECTIONS - button_dims[1]) / 2 + 8,
+                    (self.WIDTH / 2 - button_x_separation/2), (Y_POS_SECTIONS + button_dims[1]) / 2 + 8)
+        compositor["pause"].update(xy = button_xy, text = button_label)
 
-            draw.text(xy = (X_Pos, Y_Pos + section_height / 2), text = section["Section"],
-                    fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="lm", align="center")
-            
-            font = ImageFont.truetype(font=self.font_name, size=10)
-            X_Pos += 90
-            draw.text(xy = (X_Pos, Y_Pos + section_height / 2), text = section["Unit"], 
-                    fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="mm")
-            
+        button_xy = ((self.WIDTH / 2 + button_x_separation/2), (Y_POS_SECTIONS - button_dims[1]) / 2 + 8,
+                        (self.WIDTH / 2 + button_x_separation/2 + button_dims[0]), (Y_POS_SECTIONS + button_dims[1]) / 2 + 8)
+        compositor["end"].update(xy = button_xy)
+
+        for i, name in ((0, "elapsed"), (2, "remaining")):
+            compositor[name+"_total"].update(text = str(box_Labels[i][1]))
+            compositor[name+"_segment"].update(text = str(box_Labels[i][2]))
+
+        for i, section in enumerate(all_sections):
             if "Zone" in section:
                 font_size = 12
-                font = ImageFont.truetype(font=self.font_name, size=font_size)
+                font = get_font(self.font_name, font_size)
                 while font.getlength(str(section["Value"])) > 40:
                     font_size -= 1
-                    font = ImageFont.truetype(font=self.font_name, size=font_size)
+                    font = get_font(self.font_name, font_size)
 
                 value = str(section["Zone"])
                 if value ==  "Recovery":
@@ -1504,47 +2288,13 @@ class ScreenManager:
                 else:
                     colour = self.COLOUR_TEXT_LIGHT
             
-                draw.text(xy = (X_Pos, Y_Pos + section_height / 4 *2.8), text = value, fill = colour, font = font, anchor="mm")
+                compositor["zone"].update(text = value, fill = colour, font = font)
                 
-            font = ImageFont.truetype(font=self.font_name, size=16)
-            X_Pos += 60
-            draw.text(xy = (X_Pos, Y_Pos+15), text = section["Value"], fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="mm")
-
-            font = ImageFont.truetype(font=self.font_name, size=8)
-            draw.text(xy = (X_Pos, Y_Pos+section_height / 4 * 3), text = "A: "+section["Average"]+" M: "+section["Max"], 
-                    fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="mm")
-
-            
-            
-            Y_Pos += section_height
-            draw.line(xy = (self.MARGIN_SMALL, Y_Pos, 204-self.MARGIN_SMALL, Y_Pos), fill  = self.COLOUR_OUTLINE, width = LINE_THICKNESS)
-
-        Y_Pos = Y_POS_SECTIONS
-        X_Pos = 204 + self.MARGIN_SMALL
-        draw.rounded_rectangle(xy= (X_Pos, Y_Pos, self.WIDTH, self.HEIGHT), radius=8, fill=self.COLOUR_BG_LIGHT)
-
+            compositor["value"+str(i)].update(text = section["Value"])
+            compositor["stats"+str(i)].update(text = "A: "+section["Average"]+" M: "+section["Max"])
 
         if workoutType == "Program":
-            Y_Pos += 6
-            box_centre_x = (X_Pos+self.WIDTH)/2
-            font = ImageFont.truetype(font=self.font_name, size=12)
-            draw.text(xy = (box_centre_x, Y_Pos), text = "Difficulty\nControl", align="center", 
-                    fill = self.COLOUR_TEXT_LIGHT, font = font, anchor="ma")
-            
-            Y_Pos += 40
-            arrow_w = 6
-            arrow_h = 16
-            draw.polygon(xy=(box_centre_x, Y_Pos, box_centre_x-arrow_w, Y_Pos+arrow_h, box_centre_x+arrow_w, Y_Pos+arrow_h), fill=self.COLOUR_BUTTON)
-            arrow_box = (box_centre_x-2*arrow_w, Y_Pos-20, box_centre_x+2*arrow_w, Y_Pos+arrow_h)
-            touchActiveRegions += ((arrow_box, "Increase"),)
-            
-            Y_Pos += 30
-            font = ImageFont.truetype(font=self.font_name, size=14)
-            draw.text(xy=(box_centre_x, Y_Pos), text=str(multiplier)+"%", fill=self.COLOUR_OUTLINE, anchor="mm", font=font)
-            Y_Pos += 16
-            draw.polygon(xy=(box_centre_x-arrow_w, Y_Pos, box_centre_x+arrow_w, Y_Pos, box_centre_x, Y_Pos+arrow_h), fill=self.COLOUR_BUTTON)
-            arrow_box = (box_centre_x-2*arrow_w, Y_Pos, box_centre_x+2*arrow_w, Y_Pos+arrow_h+20)
-            touchActiveRegions += ((arrow_box, "Decrease"),)
+            compositor["multiplier"].update(text = str(multiplier)+"%")
             
             chart_w = 98
             chart_h = 50
@@ -1559,23 +2309,18 @@ class ScreenManager:
             if state_of_charge is not None and state_of_charge < 25:
                 image_segments_chart = image_segments_chart.convert("L")
                 image_segments_chart = image_segments_chart.convert("RGB")
+                image_battery = self.get_sprite("battery", self.ICON_HEIGHT_BATTERY, (self.COLOUR_BG_LIGHT,), state_of_charge)
+                battery_xy = (int(chart_w / 2 - image_battery.width / 2), int(chart_h / 2 - image_battery.height / 2))
+                image_segments_chart.paste(image_battery, battery_xy)
               
-            segments_xy = (204 + 2 * self.MARGIN_SMALL, self.HEIGHT - self.MARGIN_SMALL - chart_h )
-            self.display.buffer.paste(image_segments_chart, segments_xy)
-            
-            if state_of_charge is not None and state_of_charge < 25:
-                image_battery = self.draw_battery(26, state_of_charge, self.COLOUR_BG_LIGHT)
-                battery_xy = (int(segments_xy[0] + chart_w / 2 - image_battery.width / 2), 
-                              int(segments_xy[1] + chart_h / 2 - image_battery.height / 2))
-                self.display.buffer.paste(image_battery, battery_xy)
-            
+            compositor["segments"].update(image = image_segments_chart)
             
-        elif workoutType == "Freeride":
-            pass
+        for name, value in (("power", self.dataContainer.momentary.power), ("heart_rate", self.dataContainer.momentary.heartRate)):
+            chart: LiveChart = compositor[name+"_chart"]
+            chart.sample(self.dataContainer.workoutTime, value)
+            compositor[name+"_scale"].update(text = str(chart.low) + "-" + str(chart.high))
 
-        self.display.display()
-        #self.im.show()
-        return touchActiveRegions
+        return self.show_page(page, compositor)
     
 
     def draw_page_user_editor(self, user: User) -> tuple:
@@ -1583,7 +2328,7 @@ class ScreenManager:
         draw = self.display.draw() # Get a PIL Draw object
         
         touchActiveRegions = tuple()
-        font = ImageFont.truetype(font=self.font_name, size=18)
+        font = get_font(self.font_name, 18)
         draw.text(xy=(self.WIDTH/2, self.MARGIN_LARGE), text="User editor", font=font, anchor="mm", fill=self.COLOUR_TEXT_LIGHT)
 
 
@@ -1592,7 +2337,7 @@ class ScreenManager:
         
         button_height = 20
         button_gap = 12
-        font = ImageFont.truetype(font=self.font_name, size=12)
+        font = get_font(self.font_name, 12)
         buttons_labels = ("Finish", "Add new user", "Delete user", "Change user")
 
         button_width = max([int(font.getlength(text=label))+12 for label in buttons_labels])
@@ -1638,7 +2383,7 @@ class ScreenManager:
             button_y += button_height+button_gap
             touchActiveRegions += ((button_xy, label),)
 
-        self.display.display()
+        self.refresh()
         return touchActiveRegions
 
 
@@ -1649,7 +2394,7 @@ class ScreenManager:
         draw = self.display.draw() # Get a PIL Draw object
         
         touchActiveRegions = tuple()
-        font = ImageFont.truetype(font=self.font_name, size=18)
+        font = get_font(self.font_name, 18)
         draw.text(xy=(self.WIDTH/2, self.MARGIN_LARGE), text="MQTT Settings", font=font, anchor="mm", fill=self.COLOUR_TEXT_LIGHT)
 
         BUTTONS_X = 270
@@ -1657,7 +2402,7 @@ class ScreenManager:
         
         button_height = 20
         button_gap = 14
-        font = ImageFont.truetype(font=self.font_name, size=12)
+        font = get_font(self.font_name, 12)
         buttons_labels = ("Save", "Discard")
 
         button_width = max([int(font.getlength(text=label))+12 for label in buttons_labels])
@@ -1690,7 +2435,7 @@ class ScreenManager:
             touchActiveRegions += ((button_xy, label),)
 
 
-        self.display.display()
+        self.refresh()
         return touchActiveRegions
 
 
@@ -1702,7 +2447,7 @@ class ScreenManager:
         self.display.clear(self.COLOUR_BG)
         draw = self.display.draw() # Get a PIL Draw object
 
-        font = ImageFont.truetype(font=self.font_name, size=16)
+        font = get_font(self.font_name, 16)
         #draw = ImageDraw.Draw(self.im)
         
         triangleWidth = 10
@@ -1770,11 +2515,11 @@ class ScreenManager:
 
             pos_x = BOX_X+80
             pos_y = box_y + 40
-            font=ImageFont.truetype(font=self.font_name, size=14)
+            font=get_font(self.font_name, 14)
 
             draw.text(xy=(pos_x, box_y+16), text=userList.listOfUsers[i].Name, font=font, anchor="lm", fill=self.COLOUR_FILL)
 
-            font=ImageFont.truetype(font=self.font_name, size=9)
+            font=get_font(self.font_name, 9)
 
             labels_col1 = ("Times riden: ", "Total Distance:", "Total Energy:")
             values_col1 = (userList.listOfUsers[i].noWorkouts, round(userList.listOfUsers[i].totalDistance,1), round(userList.listOfUsers[i].totalEnergy,0))
@@ -1798,7 +2543,7 @@ class ScreenManager:
 
             box_y += BOX_HEIGHT+20
         
-        self.display.display()
+        self.refresh()
 
         return touchActiveRegions
 
@@ -1806,11 +2551,6 @@ class ScreenManager:
     #def drawPageMainMenu(self, colour_heart: tuple, colour_trainer: tuple, colour_climber: tuple) -> tuple:
     def drawPageMainMenu(self, colour_heart: tuple, colour_trainer: tuple, state_of_charge:int = None) -> tuple:
         
-        self.display.clear(self.COLOUR_BG)
-        draw = self.display.draw() # Get a PIL Draw object
-        #draw = ImageDraw.Draw(self.im)
-        touchActiveRegions = tuple()
-
         noBoxes = (3, 2)    # in x and y
         box_width  = int((self.WIDTH - self.MARGIN_LARGE * (noBoxes[0]+1))/noBoxes[0])
         box_height = int(box_width  * 0.8)
@@ -1818,53 +2558,56 @@ class ScreenManager:
 
         stateMachineStates = ("UserChange", "History", "Settings", "ProgEdit", "RideProgram", "Freeride", "ProgSelect")
         
-        HEART_HEIGHT = 23
-        TRAINER_HEIGHT = 27
-        image_heart   = self.drawHeart(HEART_HEIGHT, colour_heart, self.COLOUR_OUTLINE, self.COLOUR_BG)
-        image_trainer = self.drawTrainer(TRAINER_HEIGHT, colour_trainer, self.COLOUR_OUTLINE, self.COLOUR_BG)
-        #image_climber = self.drawClimber(DEVICES_HEIGHT, colour_climber, self.COLOUR_OUTLINE, self.COLOUR_BG)
-        image_battery = self.draw_battery(26, state_of_charge, self.COLOUR_BG)
-        
+        def draw_static(draw: ImageDraw.ImageDraw) -> tuple:
+            touchActiveRegions = tuple()
 
-        Y_Pos = self.MARGIN_LARGE
-        X_Pos = self.WIDTH - self.MARGIN_LARGE - image_battery.width
-        self.display.buffer.paste(image_battery, (X_Pos, Y_Pos))
+            Y_Pos = self.ICON_HEIGHT_HEART + 3 * self.MARGIN_LARGE
+            X_Pos = self.MARGIN_LARGE
+            for i, zipped in enumerate(zip(box_labels, stateMachineStates)):
+                
+                label, state = zipped
 
-        X_Pos = int(self.MARGIN_LARGE*1.5 + box_width -image_heart.width/2)
+                box_xy = (X_Pos, Y_Pos, X_Pos + box_width, Y_Pos + box_height)
 
-        #self.display.buffer
-        self.display.buffer.paste(image_heart, (X_Pos, Y_Pos))
-       
-        X_Pos = int(self.WIDTH/2 - image_trainer.width/2)
-        self.display.buffer.paste(image_trainer, (X_Pos, Y_Pos))
+                draw.rounded_rectangle(xy = box_xy, radius = 4, fill = self.COLOUR_BG_LIGHT, outline = self.COLOUR_OUTLINE, width = 5)
+                
+                touchActiveRegions += ((box_xy, state),)
+                
+                font = get_font(self.font_name, 12)
+                box_centre_xy = (box_xy[0] + box_width / 2, box_xy[1] + box_height / 2)
+                draw.text(xy = box_centre_xy, text = label, fill = self.COLOUR_TEXT_LIGHT, font = font, align="center", anchor="mm")
+                
+                X_Pos += box_width + 12
 
-        #X_Pos = int(self.MARGIN_LARGE*2.5 + 2*box_width -climberImage.width/2)
-        #self.im.paste(climberImage, (X_Pos, Y_Pos))
+                if i + 1 == noBoxes[0]:
+                    X_Pos = self.MARGIN_LARGE
+                    Y_Pos += box_height + 25
 
-        Y_Pos = HEART_HEIGHT + 3 * self.MARGIN_LARGE
-        X_Pos = self.MARGIN_LARGE
-        for i, zipped in enumerate(zip(box_labels, stateMachineStates)):
-            
-            label, state = zipped
+            return touchActiveRegions
 
-            box_xy = (X_Pos, Y_Pos, X_Pos + box_width, Y_Pos + box_height)
+        page = ("MainMenu",)
+        compositor: Compositor = self.compositors.get(page)
+        if compositor is None:
+            compositor = Compositor(*self.static_layer(page, draw_static))
 
-            draw.rounded_rectangle(xy = box_xy, radius = 4, fill = self.COLOUR_BG_LIGHT, outline = self.COLOUR_OUTLINE, width = 5)
-            
-            touchActiveRegions += ((box_xy, state),)
-            
-            font = ImageFont.truetype(font=self.font_name, size=12)
-            box_centre_xy = (box_xy[0] + box_width / 2, box_xy[1] + box_height / 2)
-            draw.text(xy = box_centre_xy, text = label, fill = self.COLOUR_TEXT_LIGHT, font = font, align="center", anchor="mm")
-            
-            X_Pos += box_width + 12
+            image_heart   = self.get_sprite("heart", self.ICON_HEIGHT_HEART, (self.COLOUR_HEART, self.COLOUR_OUTLINE, self.COLOUR_BG))
+            image_trainer = self.get_sprite("trainer", self.ICON_HEIGHT_TRAINER, (self.COLOUR_TT, self.COLOUR_OUTLINE, self.COLOUR_BG))
+            image_battery = self.get_sprite("battery", self.ICON_HEIGHT_BATTERY, (self.COLOUR_BG,), 100)
 
-            if i + 1 == noBoxes[0]:
-                X_Pos = self.MARGIN_LARGE
-                Y_Pos += box_height + 25
-                
-        self.display.display()
-        return touchActiveRegions
+            Y_Pos = self.MARGIN_LARGE
+            compositor.add("battery", Chart((self.WIDTH - self.MARGIN_LARGE - image_battery.width, Y_Pos)))
+            compositor.add("heart", Chart((int(self.MARGIN_LARGE*1.5 + box_width -image_heart.width/2), Y_Pos)))
+            compositor.add("trainer", Chart((int(self.WIDTH/2 - image_trainer.width/2), Y_Pos)))
+            #compositor.add("climber", Chart((int(self.MARGIN_LARGE*2.5 + 2*box_width -image_climber.width/2), Y_Pos)))
+
+            self.compositors[page] = compositor
+
+        #### Blinking icons are cached sprites, a blink only sends the icon's own region
+        compositor["heart"].update(image = self.get_sprite("heart", self.ICON_HEIGHT_HEART, (colour_heart, self.COLOUR_OUTLINE, self.COLOUR_BG)))
+        compositor["trainer"].update(image = self.get_sprite("trainer", self.ICON_HEIGHT_TRAINER, (colour_trainer, self.COLOUR_OUTLINE, self.COLOUR_BG)))
+        compositor["battery"].update(image = self.get_sprite("battery", self.ICON_HEIGHT_BATTERY, (self.COLOUR_BG,), state_of_charge))
+        
+        return self.show_page(page, compositor)
 
 
     def drawConnectionErrorMessage(self) -> None:
@@ -1876,16 +2619,16 @@ class ScreenManager:
 
         draw.rectangle(xy=(0,0, WIDTH-1, HEIGHT-1), outline=self.COLOUR_OUTLINE, fill=self.COLOUR_BG_LIGHT, width=2)
 
-        font = ImageFont.truetype(font=self.font_name, size=12)
+        font = get_font(self.font_name, 12)
         draw.text(xy=(WIDTH/2, 10), text="Trainer Not Connected!", anchor="mt", font=font)
-        font = ImageFont.truetype(font=self.font_name, size=9)
+        font = get_font(self.font_name, 9)
         draw.text(xy=(WIDTH/2, 47), text="Power up  or  start  pedalling\nto  wake up  the  trainer", anchor="mm", font=font, align="center")
 
         self.display.buffer = self.display.buffer.convert("L")
         self.display.buffer = self.display.buffer.convert("RGB")
 
         self.display.buffer.paste(image, (int(self.WIDTH/2-WIDTH/2), int(self.HEIGHT - HEIGHT - 40)))
-        self.display.display()
+        self.refresh()
 
     def drawTrainer(self, height: int, colour_fill: tuple, colour_outline: tuple, colour_bg: tuple) -> Image.Image:
         
@@ -1987,8 +2730,10 @@ class ScreenManager:
         return image
     
     def draw_battery(self, height: int, state_of_charge:int, background_colour: tuple) -> Image.Image:
-        fill_colour = self.COLOUR_CLIMBER if state_of_charge > 50 else self.COLOUR_OUTLINE
-        fill_colour = self.COLOUR_HEART if state_of_charge < 25 else fill_colour
+        fill_colour = None          #### no reading, the battery is drawn empty
+        if state_of_charge is not None:
+            fill_colour = self.COLOUR_CLIMBER if state_of_charge > 50 else self.COLOUR_OUTLINE
+            fill_colour = self.COLOUR_HEART if state_of_charge < 25 else fill_colour
         
         ratio = 2   ## width/height
         width = ratio * height
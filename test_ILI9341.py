@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import ILI9341 as TFT
+from displays import HeadlessDisplay
+
+
+@pytest.fixture
+def display():
+    display = HeadlessDisplay(320, 240)
+    display.begin()
+    return display
+
+
+def frame_data(image):
+    return TFT.image_to_data(image)
+
+
+#### changed_regions
+
+def test_everything_changed_while_the_panel_is_unknown(display):
+    assert display.changed_regions(frame_data(Image.new("RGB", (320, 240)))) == [(0, 0, 320, 240)]
+
+
+def test_nothing_changed_after_sending_the_same_frame(display):
+    image = Image.new("RGB", (320, 240), (10, 20, 30))
+    display.display(image)
+    assert display.changed_regions(frame_data(image)) == []
+
+
+def test_a_changed_pixel_is_reported_as_its_tile(display):
+    image = Image.new("RGB", (320, 240))
+    display.display(image)
+    image.putpixel((100, 50), (255, 255, 255))
+    tile = TFT.DIFF_TILE_SIZE
+    x0, y0 = 100 // tile * tile, 50 // tile * tile
+    assert display.changed_regions(frame_data(image)) == [(x0, y0, x0 + tile, y0 + tile)]
+
+
+def test_a_run_of_changed_tiles_is_one_box(display):
+    image = Image.new("RGB", (320, 240))
+    display.display(image)
+    tile = TFT.DIFF_TILE_SIZE
+    for x in range(tile, 4 * tile, 3):
+        image.putpixel((x, 0), (255, 0, 0))
+    image.putpixel((319, 239), (0, 0, 255))
+    assert display.changed_regions(frame_data(image)) == [(tile, 0, 4 * tile, tile),
+                                                         (320 - tile, 240 - tile, 320, 240)]
+
+
+def test_a_mostly_changed_frame_is_sent_whole(display):
+    display.display(Image.new("RGB", (320, 240)))
+    assert display.changed_regions(frame_data(Image.new("RGB", (320, 240), (255, 255, 255)))) == [(0, 0, 320, 240)]
+
+
+#### merge_regions
+
+def test_neighbouring_boxes_are_merged(display):
+    assert display.merge_regions([(0, 0, 16, 16), (16, 0, 32, 16)]) == [(0, 0, 32, 16)]
+
+
+def test_distant_boxes_stay_apart(display):
+    boxes = [(0, 0, 16, 16), (200, 200, 216, 216)]
+    assert display.merge_regions(boxes) == boxes
+
+
+def test_merged_boxes_cover_every_region(display):
+    generator = np.random.default_rng(7)
+    boxes = list()
+    for _ in range(12):
+        x, y = int(generator.integers(0, 300)), int(generator.integers(0, 220))
+        boxes.append((x, y, x + int(generator.integers(1, 20)), y + int(generator.integers(1, 20))))
+    merged = display.merge_regions(boxes)
+    assert len(merged) <= len(boxes)
+    for x0, y0, x1, y1 in boxes:
+        assert any(m[0] <= x0 and m[1] <= y0 and x1 <= m[2] and y1 <= m[3] for m in merged)
+
+
+def test_most_of_the_screen_is_sent_as_one_frame(display):
+    assert display.merge_regions([(0, 0, 320, 200), (0, 220, 10, 230)]) == [(0, 0, 320, 240)]
+
+
+#### image_to_data
+
+@pytest.mark.parametrize("mode", ("P", "L"))
+def test_paletted_and_greyscale_images_convert_like_rgb(mode):
+    generator = np.random.default_rng(11)
+    image = Image.fromarray(generator.integers(0, 256, (24, 32, 3), dtype=np.uint8), "RGB").convert(mode)
+    assert np.array_equal(TFT.image_to_data(image), TFT.image_to_data(image.convert("RGB")))
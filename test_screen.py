@@ -0,0 +1,176 @@
+import os
+import random
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+pytest.importorskip("paho.mqtt.client")     # screen imports the MQTT exporter
+
+from screen import TouchIndex, TouchScreen, LiveChart, downsample, get_font, get_glyph_atlas
+
+FONT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Roboto-Regular.ttf")
+
+
+def linear_hit(regions, point):
+    for region in regions:
+        x1, y1, x2, y2 = region[0]
+        if x1 <= point[0] <= x2 and y1 <= point[1] <= y2:
+            return region[1]
+    return None
+
+
+#### TouchIndex
+
+def test_touch_index_matches_a_linear_search():
+    generator = random.Random(1)
+    regions = tuple(((x, y, x + generator.randint(4, 120), y + generator.randint(4, 90)), number)
+                    for number, (x, y) in enumerate((generator.randint(-20, 300), generator.randint(-20, 220)) for _ in range(40)))
+    index = TouchIndex(regions)
+    points = [(generator.uniform(0, 319.9), generator.uniform(0, 239.9)) for _ in range(5000)] + [(x, y) for x in range(0, 320, 4) for y in range(240)]
+    assert [index.hit(point) for point in points] == [linear_hit(regions, point) for point in points]
+
+
+def test_touch_index_boxes_are_inclusive():
+    index = TouchIndex((((10, 20, 30, 40), "Button"),))
+    assert index.hit((10, 20)) == "Button"
+    assert index.hit((30, 40)) == "Button"
+    assert index.hit((30.5, 40)) is None
+    assert index.hit((9, 30)) is None
+
+
+def test_touch_index_first_region_wins_on_shared_edges():
+    index = TouchIndex((((0, 0, 50, 50), "Left"), ((50, 0, 100, 50), "Right")))
+    assert index.hit((50, 25)) == "Left"
+    assert index.hit((51, 25)) == "Right"
+
+
+def test_touch_index_higher_layer_is_on_top():
+    regions = (((0, 0, 100, 100), "Page"),
+               ((20, 20, 60, 60), "Popup", 1),
+               ((40, 40, 80, 80), "Behind"))
+    index = TouchIndex(regions)
+    assert index.hit((30, 30)) == "Popup"
+    assert index.hit((50, 50)) == "Popup"
+    assert index.hit((70, 70)) == "Page"
+
+
+def test_touch_index_outside_the_screen():
+    index = TouchIndex((((-50, -50, 400, 300), "Everywhere"),), 320, 240)
+    assert index.hit((0, 0)) == "Everywhere"
+    assert index.hit((319, 239)) == "Everywhere"
+    assert index.hit((-1, 10)) is None
+    assert index.hit((10, 240)) is None
+
+
+#### calibration
+
+AFFINE = (0.004, -0.087, 330.0, -0.066, 0.003, 254.0)
+TARGETS = ((20, 20), (300, 20), (300, 220), (20, 220), (160, 190))
+
+
+def touch_screen() -> TouchScreen:
+    #### the calibration is plain arithmetic, no touch controller is needed for it
+    touch = TouchScreen.__new__(TouchScreen)
+    touch.WIDTH, touch.HEIGHT = 320, 240
+    return touch
+
+
+def raw_readings(targets, affine=AFFINE) -> list:
+    a, b, c, d, e, f = affine
+    transform = np.array(((a, b), (d, e)))
+    return [tuple(np.linalg.solve(transform, np.subtract(target, (c, f)))) for target in targets]
+
+
+def test_calibration_recovers_the_affine_transform():
+    touch = touch_screen()
+    calibration = touch.calculateCalibrationConstants(TARGETS, raw_readings(TARGETS))
+    assert calibration == pytest.approx(AFFINE, abs=1e-6)
+    assert touch.affine == calibration
+    for target, raw in zip(TARGETS, raw_readings(TARGETS)):
+        assert touch.scaleCoordinates(raw) == pytest.approx(target, abs=1)
+
+
+def test_calibration_from_three_points():
+    touch = touch_screen()
+    calibration = touch.calculateCalibrationConstants(TARGETS[:3], raw_readings(TARGETS[:3]))
+    assert calibration == pytest.approx(AFFINE, abs=1e-6)
+
+
+def test_calibration_drops_a_bad_touch():
+    measured = raw_readings(TARGETS)
+    measured[2] = raw_readings(((250, 180),))[0]        # touched 64 px away from the target
+    touch = touch_screen()
+    assert touch.calculateCalibrationConstants(TARGETS, measured) == pytest.approx(AFFINE, abs=1e-6)
+
+
+def test_calibration_keeps_touches_within_the_maximum_error():
+    generator = np.random.default_rng(3)
+    targets = np.asarray(TARGETS, dtype=float)
+    touched = targets + generator.uniform(-1, 1, targets.shape)
+    touched[4] += (TouchScreen.CALIBRATION_MAX_ERROR / 2, 0)     # off, but not by enough to be dropped
+    measured = raw_readings(touched)
+
+    rows = np.column_stack((np.asarray(measured), np.ones(len(measured))))
+    solution = np.linalg.lstsq(rows, TARGETS, rcond=None)[0]     # fit of all the touches
+    calibration = touch_screen().calculateCalibrationConstants(TARGETS, measured)
+    assert calibration == pytest.approx(tuple(solution[:, 0]) + tuple(solution[:, 1]))
+
+
+#### downsample
+
+def test_downsample_reduces_every_bucket():
+    generator = np.random.default_rng(5)
+    x = np.sort(generator.uniform(0, 3600, 5000))
+    y = generator.normal(200, 40, len(x))
+    buckets = 100
+    columns, means, minimums, maximums = downsample(x, y, buckets)
+
+    index = np.minimum(((x - x[0]) * (buckets / (x[-1] - x[0]))).astype(int), buckets - 1)
+    assert list(columns) == sorted(set(index))
+    for column, mean, minimum, maximum in zip(columns, means, minimums, maximums):
+        values = y[index == column]
+        assert mean == pytest.approx(values.mean())
+        assert minimum == values.min()
+        assert maximum == values.max()
+
+
+def test_downsample_of_a_single_instant():
+    columns, means, minimums, maximums = downsample(np.array([5.0, 5.0]), np.array([1.0, 3.0]), 10)
+    assert list(columns) == [0]
+    assert list(means) == [2.0]
+    assert (minimums[0], maximums[0]) == (1.0, 3.0)
+
+
+#### glyph atlas
+
+@pytest.mark.parametrize("size", (8, 11, 14, 16))
+@pytest.mark.parametrize("anchor", ("la", "lm", "ms", "mm", "rd", "ra"))
+def test_glyph_atlas_draws_the_same_pixels_as_draw_text(size, anchor):
+    font = get_font(FONT, size)
+    atlas = get_glyph_atlas(font)
+    #### the text stays inside the image, so the bounding box of the ink is not clipped
+    for xy, text in (((90, 20), "12:34"), ((90.5, 30), "-0.5%"), ((93, 17.25), "245 AM"), ((100, 24), "+1,000/9"), ((90, 24.5), "AA/A,")):
+        assert atlas.supports(text, anchor)
+        expected = Image.new("RGB", (200, 48))
+        ImageDraw.Draw(expected).text(xy, text, fill=(250, 200, 10), font=font, anchor=anchor)
+
+        composed = Image.new("RGB", (200, 48))
+        bbox, mask = atlas.layout(xy, text, anchor)
+        composed.paste((250, 200, 10), bbox[:2], mask)
+
+        assert np.array_equal(np.asarray(composed), np.asarray(expected)), (xy, text)
+        assert bbox == expected.getbbox()
+
+
+#### live chart
+
+def test_live_chart_damages_only_the_overwritten_columns_when_wrapping():
+    chart = LiveChart((10, 10), (20, 8), (255, 0, 0), (100, 0, 0), (0, 0, 0), (0, 100))
+    chart.bounds = (10, 10, 30, 18)         # already on the screen
+    for second in range(19):
+        chart.sample(second, 50)
+        chart.damage = None
+    chart.sample(19, 50)                    # written at column 19, the gap wraps to columns 0 to 3
+    assert chart.columns() == [(0, 4), (19, 20)]
+    assert chart.damaged(None) == ((10, 10, 14, 18), (29, 10, 30, 18))
@@ -0,0 +1,31 @@
+"""Recording of the touches handled by Supervisor.touchTester, as JSON lines. Replayed by touch_replay.py."""
+import json
+
+from screen import TouchEvent
+
+
+class TouchRecorder:
+    """Keeps the touches handled by the Supervisor, and appends them to path if given"""
+
+    def __init__(self, path: str = None) -> None:
+        self.path = path
+        self.records = list()
+
+    def record(self, event: TouchEvent, state: str, value, frame: int = None) -> None:
+        """frame is the sequence number of the last frame queued for the display before the touch was handled"""
+        record = {"timestamp": event.timestamp, "type": event.type, "location": event.location, "raw": event.raw,
+                  "state": state, "value": value, "frame": frame}
+        self.records.append(record)
+        if self.path is not None:
+            with open(self.path, "at") as file:
+                file.write(json.dumps(record, default = str) + "\n")
+
+
+def as_recorded(value):
+    """value as it reads back from a recording"""
+    return json.loads(json.dumps(value, default = str))
+
+
+def load_recording(path: str) -> list:
+    with open(path, "rt") as file:
+        return [json.loads(line) for line in file if line.strip()]
@@ -0,0 +1,143 @@
+"""Touch recording and replay.
+
+With a "record" file set in the [TouchScreen] section of config.ini, every touch handled by
+Supervisor.touchTester is appended to it as a JSON line: the time, the location, the state of the
+Supervisor and the value of the touch region hit. Replaying a recording runs the Supervisor on the
+configured headless display (the memory backend if the TFT is configured) with the recorded
+touches instead of the panel, at real or accelerated speed, without the hardware of the device.
+It reports, as JSON, the latency from every press to the first frame on the screen drawn after the
+Supervisor handled it, and any touch resolved to a different value than when it was recorded.
+
+    python touch_replay.py keyboard_session.jsonl --speed 4 --output replay.json
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import sys
+import time
+
+from screen import TouchScreen, TouchEvent
+from profiler import FrameProfiler
+from touch_recorder import TouchRecorder, as_recorded, load_recording
+
+
+class ReplayTouchScreen(TouchScreen):
+    """Touch screen delivering recorded touches instead of sampling the panel. The gaps between the touches
+    are those of the recording divided by speed, replay starts with the first call to next_event()."""
+
+    def __init__(self, records: list, speed: float = 1.0, width: int = 320, height: int = 240) -> None:
+        # No controller to talk to, only the event queue of TouchScreen is used.
+        self.WIDTH  = width
+        self.HEIGHT = height
+        self.records = records
+        self.speed = speed
+        self.sampler: asyncio.Task = None
+        self.events: asyncio.Queue = None
+        self.loop: asyncio.AbstractEventLoop = None
+        self.delivered = list()     # events in the order they were delivered, one per record
+
+    def start_sampler(self) -> None:
+        if self.sampler is None:
+            self.sampler = asyncio.ensure_future(self.run_replay())
+
+    async def run_replay(self) -> None:
+        start = time.monotonic()
+        first = self.records[0]["timestamp"]
+        timestamp = None
+        for record in self.records:
+            await asyncio.sleep(max(0, start + (record["timestamp"] - first) / self.speed - time.monotonic()))
+            #### timestamps identify the delivered events, they have to be unique
+            timestamp = time.monotonic() if timestamp is None else max(time.monotonic(), timestamp + 1e-6)
+            event = TouchEvent(record["type"], tuple(record["location"]), timestamp,
+                               None if record["raw"] is None else tuple(record["raw"]))
+            self.delivered.append(event)
+            self.publish(event)
+
+
+class LatencyProbe(FrameProfiler):
+    """Profiler noting when every frame of display has been written to it"""
+
+    def __init__(self, display) -> None:
+        super().__init__()
+        self.display = display
+        self.frames_sent = list()       # sequence numbers of the frames written, in order
+        self.sent_times = list()        # when they were written
+
+    def frame_sent(self, page: str, convert_ms: float, spi_ms: float, spi_bytes: int) -> None:
+        super().frame_sent(page, convert_ms, spi_ms, spi_bytes)
+        self.frames_sent.append(self.display.frames_written)
+        self.sent_times.append(time.monotonic())
+
+    def latency(self, timestamp: float, frame: int) -> float:
+        """Seconds from timestamp until the first frame queued after frame was on the screen, None if none was.
+        Frames up to frame were drawn before the touch was handled, they do not answer it."""
+        index = bisect.bisect_right(self.frames_sent, frame)
+        return None if index == len(self.frames_sent) else self.sent_times[index] - timestamp
+
+
+def run(records: list, speed: float, settle: float, backend: str = None) -> dict:
+    import controler
+    from benchmark import summary
+
+    display_options = dict(controler.config["Display"]) if controler.config.has_section("Display") else dict()
+    if backend is not None:
+        display_options = {"backend": backend}
+    elif display_options.get("backend", "ili9341") == "ili9341":
+        display_options = {"backend": "memory"}     # the TFT is on the device only
+
+    touch = ReplayTouchScreen(records, speed)
+    controler.setup(touch, display_options, on_device = False)
+    probe = LatencyProbe(controler.lcd.display)
+    controler.lcd.display.profiler = probe
+    supervisor = controler.supervisor
+    supervisor.recorder = TouchRecorder()
+    supervisor.state = records[0]["state"]
+
+    async def replay() -> None:
+        session = asyncio.ensure_future(supervisor.loopy(asyncio.Lock()))
+        while touch.sampler is None:
+            await asyncio.sleep(0.01)
+        await touch.sampler
+        await asyncio.sleep(settle)     # frames answering the last touch
+        session.cancel()
+        controler.lcd.display.flush()
+
+    asyncio.run(replay())
+
+    #### touches handled by the Supervisor, by the number of their record, found from the timestamp of the event
+    numbers = {event.timestamp: i for i, event in enumerate(touch.delivered)}
+    replayed = {numbers[record["timestamp"]]: record for record in supervisor.recorder.records if record["timestamp"] in numbers}
+
+    #### latency is measured from the presses, a release does not ask for a new frame
+    presses = [i for i, record in enumerate(records) if record["type"] == "Press" and i < len(touch.delivered)]
+    latencies = [probe.latency(replayed[i]["timestamp"], replayed[i]["frame"]) if i in replayed else None for i in presses]
+    answered = [latency * 1000 for latency in latencies if latency is not None]
+    mismatches = list()
+    for i, record in enumerate(records):
+        state, value = (replayed[i]["state"], replayed[i]["value"]) if i in replayed else (None, None)
+        if state != record["state"] or as_recorded(value) != record["value"]:
+            mismatches.append({"touch": i, "recorded": [record["state"], record["value"]], "replayed": [state, as_recorded(value)]})
+
+    return {"touches": len(records), "speed": speed, "touches_handled": len(replayed),
+            "latency_ms": summary(answered) if answered else None,
+            "unanswered": len(presses) - len(answered),
+            "mismatches": mismatches}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Replay recorded touches against the Supervisor and measure touch to frame latency")
+    parser.add_argument("recording", help = "JSON lines file recorded through the [TouchScreen] record option")
+    parser.add_argument("--speed", type = float, default = 1.0, help = "replay speed, 2 replays the touches twice as fast")
+    parser.add_argument("--settle", type = float, default = 1.0, help = "seconds to wait for the screen after the last touch")
+    parser.add_argument("--backend", choices = ("memory", "png", "framebuffer"), help = "display backend, defaults to the configured headless one or memory")
+    parser.add_argument("--output", help = "write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = run(load_recording(args.recording), args.speed, args.settle, args.backend)
+    if args.output:
+        with open(args.output, "wt") as file:
+            json.dump(report, file, indent = 2)
+    else:
+        json.dump(report, sys.stdout, indent = 2)
+        print()
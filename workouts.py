@@ -124,7 +124,7 @@ class Workouts:
 
 class WorkoutManager():
     
-    def __init__(self) -> None:
+    def __init__(self, buzzer_pin: int = 16) -> None:
         self.state:str = "IDLE"
         self.currentWorkout: WorkoutProgram = None
         self.workoutStartTime = 0
@@ -136,7 +136,7 @@ class WorkoutManager():
         self.writeToTCX: bool = True
         self.filename = None
         self.TCX_Object: TCXWriter = None
-        self.buzzer = Buzzer(16)
+        self.buzzer = Buzzer(buzzer_pin) if buzzer_pin is not None else None   #### None off the device
         self.multiplier:float = 100
         self.current_segment_id = 0
         self.timer_paused = 0
@@ -192,7 +192,7 @@ class WorkoutManager():
                             #wait until device command queue empty but max 3 seconds
                             for j in range(6):
                                 await asyncio.sleep(0.5)
-                                if TurboTrainer.queue.empty() == True:
+                                if TurboTrainer.commands_pending() == False:
                                     break
 
                             if TurboTrainer.remoteControlAcquired == True:
@@ -286,7 +286,7 @@ class WorkoutManager():
                     try:
                         if self.dataContainer.currentSegment.elapsedTime < self.dataContainer.currentSegment.duration:
                             isSegmentTransition = False
-                        if 0 < self.dataContainer.currentSegment.duration - self.dataContainer.currentSegment.elapsedTime <= 3 and self.buzzer.busy == False:
+                        if 0 < self.dataContainer.currentSegment.duration - self.dataContainer.currentSegment.elapsedTime <= 3 and self.buzzer is not None and self.buzzer.busy == False:
                             beep_task = asyncio.create_task(self.buzzer.beep(3, 0.2, 1))
                             
                     except: